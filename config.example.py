@@ -39,14 +39,39 @@ DEFAULT_LLM_PROVIDER = "openai"  # 可选: openai, anthropic, vllm, volcengine,
 DEFAULT_MODEL = "gpt-4"
 DEFAULT_TEMPERATURE = 0.7
 DEFAULT_MAX_TOKENS = 2048
+ADAPTIVE_MAX_TOKENS = False  # 按历史输出长度（高百分位）自动设置 max_tokens，被截断时放大上限重试
+EMBEDDING_MODEL = None  # embedding 模型（Azure 为部署名），None 时使用各 provider 的环境变量或默认值
 
 # 重试配置
 MAX_RETRIES = 3
 RETRY_DELAY = 1.0
 MAX_RETRY_DELAY = 60.0
 
+# 超时配置
+CONNECT_TIMEOUT = 10.0  # 单次请求的连接超时（秒）
+ITEM_DEADLINE = 300.0  # 单条数据从入队到完成（含重试）的总时间预算（秒）
+
+# 传输配置
+HTTP2_PROVIDERS = []  # 使用 HTTP/2 多路复用的 provider（需要 httpx[http2]），如 ["volcengine", "azure", "aliyun"]
+COMPRESS_REQUEST_BODY = False  # 是否 gzip 压缩请求体（需服务端支持 Content-Encoding: gzip）
+
+# 录制/回放配置（离线复现、客户端基准测试）
+CASSETTE_FILE = None  # 磁带文件路径，如 "data/cache/run.cassette"；None 表示不录制
+CASSETTE_MODE = "auto"  # record: 总是请求并录制；replay: 只回放，不访问网络；auto: 有则回放，无则录制
+CASSETTE_LATENCY_SCALE = 0.0  # 回放耗时 = 录制耗时 × 该倍数，0 为内存速度
+
 # 并发配置
-MAX_WORKERS = 5
+MAX_WORKERS = 5  # 初始并发数，运行时由 AIMD 控制器自适应调整
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 64
+SCHEDULE_POLICY = "longest_first"  # 发送顺序: fifo / longest_first（长 prompt 先发，减少长尾）/ bucketed（按长度分桶）
+SCHEDULE_WINDOW = 10000  # 每读入多少条排序一次，限制排序占用的内存；None 为全部读入后排序（输入很大时慎用）
+
+# 降级与削峰配置
+FALLBACK_MODEL = None  # 积压或主模型变慢时可降级数据改用的模型，如 "qwen-turbo"；None 表示不降级
+DEGRADE_QUEUE_DEPTH = 500  # 积压（排队 + 在途）超过该值时开始降级
+DEGRADE_LATENCY = 30.0  # 主模型最近 p90 延迟超过该秒数时开始降级
+SHED_QUEUE_DEPTH = None  # 积压超过该值时直接丢弃可降级数据（status 为 shed），None 表示不丢弃
 
 # 数据路径
 DATA_INPUT_DIR = "data/input"
@@ -56,3 +81,10 @@ DATA_CACHE_DIR = "data/cache"
 # 日志配置
 LOG_LEVEL = "INFO"
 LOG_DIR = "logs"
+LOG_ASYNC = False  # 由后台线程写日志，工作线程不阻塞在文件 I/O 上
+LOG_JSON = False  # 文件日志输出为结构化 JSON 行
+LOG_RATE_LIMIT = None  # 每个调用位置每秒最多输出的日志条数，如 10；None 为不限
+
+# 追踪配置（导出 Chrome Trace / Perfetto JSON，用于分析批量任务的时间分布）
+TRACE_ENABLED = False
+TRACE_FILE = "logs/trace.json"
@@ -6,49 +6,106 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from concurrent.futures import ThreadPoolExecutor
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from tqdm import tqdm
 
-from src import DataLoader, create_llm, setup_logger
-from src.utils import retry_on_failure
+from src import ContextCacheManager, DataLoader, create_llm, setup_logger
+from src.llms import Deadline, DeadlineExceeded, tracer
+from src.data import Deduplicator, payload_key
+from src.utils import (
+    AdaptiveMaxTokens,
+    ConcurrencyController,
+    DegradationPolicy,
+    LoadShed,
+    RequeueExecutor,
+)
+from src.utils.ordering import estimate_cost, schedule
 
 import config
 
 # 设置日志
 logger = setup_logger("batch_processing.log")
 
+# 所有请求共享的固定前缀（实际使用中通常是很长的 system prompt）
+SYSTEM_PROMPT = "你是一个数据处理助手。"
 
-@retry_on_failure(max_attempts=3)
-def call_llm_with_retry(llm, messages):
-    """带重试的 LLM 调用"""
-    return llm.chat(messages)
+# 按 provider 自适应调整在途请求数（替代固定的 MAX_WORKERS）
+concurrency = ConcurrencyController()
 
 
-def process_item(item: dict, llm) -> dict:
-    """处理单条数据"""
-    try:
-        messages = [
-            {"role": "system", "content": "你是一个数据处理助手。"},
-            {"role": "user", "content": item["text"]}
-        ]
+def call_llm(llm, messages, deadline=None, **kwargs):
+    """单次 LLM 调用（占用一个自适应并发名额）"""
+    with concurrency.slot(config.DEFAULT_LLM_PROVIDER):
+        return llm.chat(messages, deadline=deadline, **kwargs)
 
-        # 使用带重试的调用
-        response = call_llm_with_retry(llm, messages)
 
-        return {
-            **item,
-            "result": response,
-            "status": "success"
-        }
-    except Exception as e:
-        logger.error(f"处理失败 (已重试 {config.MAX_RETRIES} 次): {e}")
-        return {
-            **item,
-            "result": None,
-            "status": "failed",
-            "error": str(e)
-        }
+def build_messages(item: dict) -> list:
+    """渲染单条数据的请求消息（共享前缀由 ContextCacheManager 添加）"""
+    return [
+        {"role": "user", "content": item["text"]}
+    ]
+
+
+def dedup_key(item: dict) -> str:
+    """按完整渲染后的请求内容去重"""
+    return payload_key([{"role": "system", "content": SYSTEM_PROMPT}] + build_messages(item))
+
+
+def process_item(item: dict, llm, deadline: Deadline = None, enqueued_ns: int = None) -> dict:
+    """处理单条数据（一次尝试）
+
+    llm 可以是 BaseLLM，也可以是共享前缀的 ContextCacheManager；
+    deadline 从入队时开始计时，排队超时的数据不再发送。
+    失败时抛出异常，由 RequeueExecutor 决定是否延迟重新入队。
+    """
+    if enqueued_ns is not None:
+        tracer.complete("queue_wait", enqueued_ns, id=item.get("id"))
+
+    with tracer.span("item", id=item.get("id")):
+        return _process_item(item, llm, deadline)
+
+
+def _process_item(item: dict, llm, deadline: Deadline = None) -> dict:
+    if deadline is not None:
+        deadline.check("排队中的数据")
+
+    messages = build_messages(item)
+
+    # 过载时 priority 为 high 的数据仍走主模型，其余可降级或丢弃
+    kwargs = {}
+    if isinstance(llm, DegradationPolicy):
+        kwargs["degradable"] = item.get("priority") != "high"
+
+    response = call_llm(llm, messages, deadline=deadline, **kwargs)
+
+    output = {
+        **item,
+        "result": response,
+        "status": "success"
+    }
+    if isinstance(llm, DegradationPolicy):
+        output["served_by"] = llm.last_served()
+    return output
+
+
+def failed_output(item: dict, error: BaseException) -> dict:
+    """把最终失败（重试耗尽、超时或被丢弃）转换为输出"""
+    if isinstance(error, LoadShed):
+        status = "shed"
+    elif isinstance(error, DeadlineExceeded):
+        logger.warning(f"处理超时，已放弃: {error}")
+        status = "expired"
+    else:
+        logger.error(f"处理失败: {error}")
+        status = "failed"
+    return {
+        **item,
+        "result": None,
+        "status": status,
+        "error": str(error)
+    }
 
 
 def main():
@@ -60,6 +117,37 @@ def main():
     llm = create_llm()
     logger.info(f"使用Provider: {config.DEFAULT_LLM_PROVIDER}")
 
+    if getattr(config, "TRACE_ENABLED", False):
+        tracer.enable()
+
+    # 共享的 system prompt 只在服务端预填充一次
+    cached_llm = ContextCacheManager(llm, [{"role": "system", "content": SYSTEM_PROMPT}])
+
+    # 按历史输出长度设置 max_tokens，少占 TPM 配额；被截断的调用自动放大上限重试
+    adaptive = None
+    if getattr(config, "ADAPTIVE_MAX_TOKENS", False):
+        adaptive = AdaptiveMaxTokens(
+            cached_llm,
+            state_path=Path(config.DATA_CACHE_DIR) / "max_tokens.json",
+            template_fn=lambda messages: "batch",
+        )
+        cached_llm = adaptive
+
+    # 积压过深或主模型变慢时，可降级的数据改用更快的降级模型（或直接丢弃），积压消化后自动恢复
+    degradation = None
+    fallback_model = getattr(config, "FALLBACK_MODEL", None)
+    if fallback_model or getattr(config, "SHED_QUEUE_DEPTH", None):
+        fallback = None
+        if fallback_model:
+            fallback = ContextCacheManager(
+                create_llm(model=fallback_model), [{"role": "system", "content": SYSTEM_PROMPT}]
+            )
+        # 积压 = 线程池中排队的 + 等待重试的（requeue 在下方创建）+ 等待并发名额的
+        degradation = DegradationPolicy(
+            cached_llm, fallback, backlog_fn=lambda: requeue.backlog() + concurrency.waiting()
+        )
+        cached_llm = degradation
+
     # 2. 加载数据
     loader = DataLoader(config.DATA_INPUT_DIR)
 
@@ -74,27 +162,73 @@ def main():
     loader.save_jsonl(sample_data, "sample_input.jsonl")
     logger.info("示例数据已保存到 data/input/sample_input.jsonl")
 
-    # 从文件加载
-    data = loader.load_jsonl("sample_input.jsonl")
-    logger.info(f"加载了 {len(data)} 条数据")
-
-    # 3. 批量处理（并发）
-    logger.info(f"开始批量处理（并发数: {config.MAX_WORKERS}）...")
-
-    with ThreadPoolExecutor(max_workers=config.MAX_WORKERS) as executor:
-        futures = [executor.submit(process_item, item, llm) for item in data]
+    # 3. 去重：相同请求只发送一次（索引在磁盘上，可处理大于内存的输入）
+    dedup = Deduplicator(Path(config.DATA_CACHE_DIR) / "batch_dedup.sqlite", dedup_key)
+    unique_items = dedup.unique(loader.iter_jsonl("sample_input.jsonl"))
+
+    # 按 prompt 长度调度（默认长的先发），避免文件末尾的超长请求拖成长尾；
+    # 每 SCHEDULE_WINDOW 条排序一次，内存占用不随输入大小增长；
+    # 输出由 fan_out 按输入文件顺序回填，不受发送顺序影响
+    policy = getattr(config, "SCHEDULE_POLICY", "longest_first")
+    scheduled = schedule(
+        unique_items,
+        cost_fn=lambda pair: estimate_cost(build_messages(pair[1])),
+        policy=policy,
+        window=getattr(config, "SCHEDULE_WINDOW", 10000),
+    )
+
+    # 4. 批量处理（并发）
+    logger.info(
+        f"开始批量处理（初始并发数: {config.MAX_WORKERS}，"
+        f"上限: {getattr(config, 'MAX_CONCURRENCY', 64)}，调度策略: {policy}）..."
+    )
+
+    # 线程池按并发上限开足，实际在途请求数由 concurrency 控制
+    with ThreadPoolExecutor(max_workers=getattr(config, "MAX_CONCURRENCY", 64)) as executor:
+        # 失败的尝试按退避时间放入延迟队列，到期再重新提交，工作线程不在重试间隔中 sleep
+        requeue = RequeueExecutor(executor, max_retries=3)
+        futures = {
+            requeue.submit(
+                process_item, item, cached_llm,
+                deadline=Deadline(getattr(config, "ITEM_DEADLINE", 300.0)),
+                enqueued_ns=time.perf_counter_ns(),
+            ): (key, item)
+            for _, (key, item) in scheduled
+        }
 
-        results = []
-        for future in tqdm(futures, desc="处理中"):
-            results.append(future.result())
+        for future in tqdm(as_completed(futures), total=len(futures), desc="处理中"):
+            key, item = futures[future]
+            try:
+                output = future.result()
+            except Exception as e:
+                output = failed_output(item, e)
+            dedup.store(key, {
+                k: output[k] for k in ("result", "status", "error", "served_by") if k in output
+            })
+        requeue.shutdown()
+        logger.info(f"重新入队重试 {requeue.retries} 次")
+
+    # 5. 结果回填到每条原始数据并保存
+    results = list(dedup.fan_out(loader.iter_jsonl("sample_input.jsonl")))
+    dedup.close()
 
-    # 4. 保存结果
     output_loader = DataLoader(config.DATA_OUTPUT_DIR)
     output_loader.save_jsonl(results, "sample_output.jsonl")
 
-    # 5. 统计
+    # 6. 统计
     success_count = sum(1 for r in results if r["status"] == "success")
     logger.info(f"处理完成: {success_count}/{len(results)} 成功")
+    logger.info(f"最终并发上限: {concurrency.limits()}")
+    if degradation is not None:
+        logger.info(f"降级策略统计: {degradation.stats()}")
+    if adaptive is not None:
+        adaptive.save()
+        logger.info(f"输出长度统计: {adaptive.stats()}")
+
+    if tracer.enabled:
+        trace_file = getattr(config, "TRACE_FILE", "logs/trace.json")
+        count = tracer.export_chrome_trace(trace_file)
+        logger.info(f"已导出 {count} 个追踪事件到 {trace_file}（可在 ui.perfetto.dev 打开）")
 
 
 if __name__ == "__main__":
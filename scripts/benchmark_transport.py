@@ -0,0 +1,209 @@
+"""传输层基准测试：HTTP/1.1 vs HTTP/2、请求体压缩
+
+默认启动两个本地 OpenAI 兼容的替身服务（都支持 gzip 请求体）：
+HTTP/1.1 服务用于 http2=False，h2c（明文 HTTP/2，需要 h2，随 httpx[http2] 安装）
+服务用于 http2=True，客户端以 prior knowledge 方式直接走 HTTP/2，可以测到多路复用。
+也可以通过 --base-url 指向真实或自建的服务端（HTTP/2 需要 https + ALPN）。
+每行都会打印实际协商到的协议。
+
+    python scripts/benchmark_transport.py --requests 500 --concurrency 32 --prompt-chars 20000
+"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import argparse
+import gzip
+import importlib.util
+import json
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.llms import CustomLLM, create_transport
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """本地 HTTP/1.1 替身服务"""
+
+    protocol_version = "HTTP/1.1"
+    received_bytes = 0
+    connections = set()
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            StandInHandler.connections.add(self.client_address)
+        body = respond(raw, self.headers.get("Content-Encoding", ""))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # 默认 5，高并发新建连接时会被拒绝
+
+
+def start_stand_in() -> str:
+    """启动本地替身服务，返回 base_url"""
+    server = StandInServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+def respond(raw: bytes, encoding: str) -> bytes:
+    """替身服务的处理逻辑：统计上传字节、解压请求体并回显长度"""
+    with StandInHandler.lock:
+        StandInHandler.received_bytes += len(raw)
+    if encoding == "gzip":
+        raw = gzip.decompress(raw)
+    payload = json.loads(raw)
+    return json.dumps({
+        "choices": [{"message": {"content": f"ok {len(payload['messages'][-1]['content'])}"}}]
+    }).encode("utf-8")
+
+
+def serve_h2c_connection(sock: socket.socket, address) -> None:
+    """处理一个 h2c 连接上的所有并发流"""
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.settings
+
+    conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False))
+    # 与常见服务端一样放大接收窗口，大请求体并发上传时不必频繁等待 WINDOW_UPDATE
+    conn.local_settings = h2.settings.Settings(
+        client=False, initial_values={h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: 2 ** 24}
+    )
+    conn.initiate_connection()
+    conn.increment_flow_control_window(2 ** 30)
+    sock.sendall(conn.data_to_send())
+    with StandInHandler.lock:
+        StandInHandler.connections.add(address)
+
+    streams = {}
+    with sock:
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    headers = {k.decode().lower(): v.decode() for k, v in event.headers}
+                    streams[event.stream_id] = (headers, bytearray())
+                elif isinstance(event, h2.events.DataReceived):
+                    streams[event.stream_id][1].extend(event.data)
+                    # 归还流控窗口，否则大请求体会把连接窗口耗尽
+                    conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    headers, raw = streams.pop(event.stream_id)
+                    body = respond(bytes(raw), headers.get("content-encoding", ""))
+                    conn.send_headers(event.stream_id, [
+                        (":status", "200"),
+                        ("content-type", "application/json"),
+                        ("content-length", str(len(body))),
+                    ])
+                    conn.send_data(event.stream_id, body, end_stream=True)
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    sock.sendall(conn.data_to_send())
+                    return
+            sock.sendall(conn.data_to_send())
+
+
+def start_h2c_stand_in() -> str:
+    """启动本地 h2c（明文 HTTP/2）替身服务，返回 base_url；未安装 h2 时抛出 ImportError"""
+    if importlib.util.find_spec("h2") is None:
+        raise ImportError('h2c 替身服务需要 h2，请运行: pip install "httpx[http2]"')
+
+    server = socket.create_server(("127.0.0.1", 0), backlog=1024)
+
+    def accept() -> None:
+        while True:
+            sock, address = server.accept()
+            threading.Thread(target=serve_h2c_connection, args=(sock, address), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return f"http://127.0.0.1:{server.getsockname()[1]}/v1"
+
+
+def run_case(base_url: str, http2: bool, compress: bool, args) -> None:
+    """跑一组配置并打印结果"""
+    # 本地 h2c 替身没有 TLS/ALPN，需以 prior knowledge 方式直接使用 HTTP/2
+    kwargs = {"http1": False} if http2 and args.base_url is None else {}
+    transport = create_transport(http2=http2, compress=compress, **kwargs)
+    llm = CustomLLM(model="bench", api_key="bench", base_url=base_url, transport=transport)
+    prompt = "数据" * (args.prompt_chars // 2)
+    messages = [{"role": "user", "content": prompt}]
+
+    StandInHandler.received_bytes = 0
+    StandInHandler.connections = set()
+    latencies = []
+
+    # 记录实际协商到的协议版本（服务端不支持 HTTP/2 时 httpx 会退回 HTTP/1.1）
+    versions = {"HTTP/1.1"} if not http2 else set()
+    if http2:
+        transport.client.event_hooks["response"].append(lambda r: versions.add(r.http_version))
+
+    def one(_):
+        start = time.perf_counter()
+        llm.chat(messages)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+    transport.close()
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    line = (
+        f"http2={http2!s:<5} compress={compress!s:<5} "
+        f"协议: {'/'.join(sorted(versions)):<8}  "
+        f"吞吐: {args.requests / elapsed:8.1f} req/s  p50: {p50 * 1000:7.1f} ms  p99: {p99 * 1000:7.1f} ms"
+    )
+    if args.base_url is None:
+        line += (
+            f"  上传: {StandInHandler.received_bytes / args.requests / 1024:7.1f} KiB/req"
+            f"  连接数: {len(StandInHandler.connections)}"
+        )
+    if http2 and "HTTP/2" not in versions:
+        line += "  （未协商到 HTTP/2，不代表多路复用的效果）"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传输层基准测试")
+    parser.add_argument("--base-url", default=None, help="服务端地址，默认启动本地替身服务")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--prompt-chars", type=int, default=10000)
+    args = parser.parse_args()
+
+    for http2 in (False, True):
+        try:
+            if args.base_url:
+                base_url = args.base_url
+            else:
+                base_url = start_h2c_stand_in() if http2 else start_stand_in()
+            for compress in (False, True):
+                run_case(base_url, http2, compress, args)
+        except ImportError as e:
+            print(f"跳过 http2={http2}: {e}")
+
+
+if __name__ == "__main__":
+    main()
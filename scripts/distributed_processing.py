@@ -0,0 +1,77 @@
+"""多机分布式批量处理示例（共享文件系统租约）
+
+在每台机器上运行相同的命令，所有机器自动分摊同一个输入文件:
+
+    python scripts/distributed_processing.py --work-dir /shared/job1 \\
+        --input /shared/input.jsonl --output /shared/output.jsonl
+
+本地可以启动多个进程模拟多台机器。
+"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import argparse
+
+from src import create_llm, setup_logger
+from src.utils import LeaseCoordinator, retry_on_failure
+
+import config
+
+# 设置日志
+logger = setup_logger("distributed_processing.log")
+
+llm = None
+
+
+@retry_on_failure(max_retries=3)
+def call_llm_with_retry(messages):
+    """带重试的 LLM 调用"""
+    return llm.chat(messages)
+
+
+def process_item(item: dict) -> dict:
+    """处理单条数据"""
+    try:
+        messages = [
+            {"role": "system", "content": "你是一个数据处理助手。"},
+            {"role": "user", "content": item["text"]}
+        ]
+        return {**item, "result": call_llm_with_retry(messages), "status": "success"}
+    except Exception as e:
+        logger.error(f"处理失败: {e}")
+        return {**item, "result": None, "status": "failed", "error": str(e)}
+
+
+def main():
+    global llm
+
+    parser = argparse.ArgumentParser(description="多机分布式批量处理")
+    parser.add_argument("--work-dir", required=True, help="共享工作目录")
+    parser.add_argument("--input", required=True, help="输入 JSONL 文件")
+    parser.add_argument("--output", required=True, help="合并后的输出文件")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="每个分片的行数")
+    parser.add_argument("--lease-ttl", type=float, default=120.0, help="租约有效期（秒）")
+    parser.add_argument("--workers", type=int, default=config.MAX_WORKERS, help="本机并发数")
+    args = parser.parse_args()
+
+    llm = create_llm()
+
+    coordinator = LeaseCoordinator(
+        args.work_dir,
+        args.input,
+        chunk_size=args.chunk_size,
+        lease_ttl=args.lease_ttl,
+    )
+    coordinator.run(process_item, workers=args.workers)
+
+    # 所有分片完成后，只有一台机器执行合并
+    if coordinator.merge(args.output):
+        logger.info(f"结果已合并到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
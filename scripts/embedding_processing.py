@@ -0,0 +1,67 @@
+"""批量向量化与相似度检索示例
+
+向量按输入文件的行号写入内存映射存储，中断后重新运行只补算缺失的行:
+
+    python scripts/embedding_processing.py --input sample_input.jsonl --query "机器学习入门"
+"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import argparse
+
+from src import DataLoader, create_llm, setup_logger
+from src.data import VectorStore
+from src.utils import retry_on_failure
+
+import config
+
+# 设置日志
+logger = setup_logger("embedding_processing.log")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量向量化与相似度检索")
+    parser.add_argument("--input", default="sample_input.jsonl", help="data/input 下的 JSONL 文件")
+    parser.add_argument("--text-key", default="text", help="待向量化的字段")
+    parser.add_argument("--store", default=None, help="向量存储目录，默认 data/cache/<输入文件名>.vectors")
+    parser.add_argument("--query", default=None, help="写入完成后检索的查询文本")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    llm = create_llm()
+    loader = DataLoader(config.DATA_INPUT_DIR)
+    store_path = args.store or Path(config.DATA_CACHE_DIR) / f"{Path(args.input).stem}.vectors"
+
+    # 预先统计行数，避免写入过程中反复扩容
+    total = sum(1 for _ in loader.iter_jsonl(args.input))
+    store = VectorStore(store_path, capacity=total)
+
+    # llm.embed 按 provider 上限分批并发请求，每批 batch_rows 行失败时整体重试
+    @retry_on_failure()
+    def embed(texts):
+        return llm.embed(texts, max_workers=config.MAX_WORKERS)
+
+    rows = ((i, item[args.text_key]) for i, item in enumerate(loader.iter_jsonl(args.input)))
+    written = store.fill(rows, embed, batch_rows=llm.max_embed_batch * config.MAX_WORKERS)
+    logger.info(f"本次写入 {written} 行，共 {store.count()}/{total} 行")
+
+    if args.query:
+        ids, scores = store.search(llm.embed([args.query])[0], k=args.top_k)
+        # 只取回命中的行，不把整个输入读入内存
+        wanted = set(ids.tolist())
+        texts = {
+            i: item[args.text_key]
+            for i, item in enumerate(loader.iter_jsonl(args.input)) if i in wanted
+        }
+        for row, score in zip(ids, scores):
+            logger.info(f"{score:.4f}  {texts[row]}")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
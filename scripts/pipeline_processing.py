@@ -0,0 +1,78 @@
+"""多阶段流式管道示例：过滤 → LLM 抽取 → 解析 → LLM 校验 → 写出"""
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import json
+
+from src import DataLoader, create_llm, setup_logger
+from src.utils import Pipeline, Stage, llm_stage
+
+import config
+
+# 设置日志
+logger = setup_logger("pipeline_processing.log")
+
+
+def keep_non_empty(item: dict):
+    """过滤空文本"""
+    return item if item.get("text", "").strip() else None
+
+
+def build_extract_messages(item: dict) -> list:
+    """抽取关键词"""
+    return [
+        {"role": "system", "content": "从用户文本中抽取关键词，只输出 JSON 数组。"},
+        {"role": "user", "content": item["text"]}
+    ]
+
+
+def parse_keywords(item: dict) -> dict:
+    """解析抽取结果"""
+    try:
+        keywords = json.loads(item["extracted"])
+    except (json.JSONDecodeError, TypeError):
+        keywords = []
+    return {**item, "keywords": keywords}
+
+
+def build_verify_messages(item: dict) -> list:
+    """校验关键词是否覆盖原文要点"""
+    return [
+        {"role": "system", "content": "判断关键词是否覆盖了原文要点，只回答 是 或 否。"},
+        {"role": "user", "content": f"原文: {item['text']}\n关键词: {item['keywords']}"}
+    ]
+
+
+def main():
+    logger.info("=" * 50)
+    logger.info("多阶段流式管道示例")
+    logger.info("=" * 50)
+
+    # 不同阶段可以使用不同的 provider / 模型和各自的缓存
+    extract_llm = create_llm()
+    verify_llm = create_llm()
+
+    pipeline = Pipeline([
+        Stage("filter", keep_non_empty),
+        llm_stage("extract", extract_llm, build_extract_messages, "extracted",
+                  workers=config.MAX_WORKERS, cache={}),
+        Stage("parse", parse_keywords),
+        llm_stage("verify", verify_llm, build_verify_messages, "verified", workers=2),
+    ])
+
+    input_loader = DataLoader(config.DATA_INPUT_DIR)
+    output_loader = DataLoader(config.DATA_OUTPUT_DIR)
+
+    # 数据逐条流经各阶段，边处理边写出，不产生中间文件
+    output_loader.save_jsonl(
+        pipeline.run(input_loader.iter_jsonl("sample_input.jsonl")),
+        "pipeline_output.jsonl"
+    )
+
+
+if __name__ == "__main__":
+    main()
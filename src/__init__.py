@@ -9,6 +9,8 @@ from .llms import (
     AzureLLM,
     CustomLLM,
     AliyunLLM,
+    ContextCacheManager,
+    Conversation,
 )
 from .data import DataLoader
 from .utils import create_llm, setup_logger, retry_on_failure
@@ -21,6 +23,8 @@ __all__ = [
     "AzureLLM",
     "CustomLLM",
     "AliyunLLM",
+    "ContextCacheManager",
+    "Conversation",
     "DataLoader",
     "create_llm",
     "setup_logger",
@@ -1,4 +1,7 @@
 """数据模块"""
 from .loader import DataLoader
+from .dataset import JsonlDataset
+from .dedup import Deduplicator, payload_key
+from .vector_store import VectorStore
 
-__all__ = ["DataLoader"]
+__all__ = ["DataLoader", "JsonlDataset", "Deduplicator", "payload_key", "VectorStore"]
@@ -0,0 +1,199 @@
+"""多文件数据集读取（后台预取）"""
+import glob
+import gzip
+import json
+import queue
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Union
+
+from loguru import logger
+
+_END = object()
+
+
+class _FileReader(threading.Thread):
+    """后台读取并解析单个文件，结果写入有界队列"""
+
+    def __init__(
+        self,
+        path: Path,
+        name: str,
+        maxsize: int,
+        stop: threading.Event,
+        skip_invalid: bool,
+    ):
+        super().__init__(name=f"dataset-{name}", daemon=True)
+        self.path = path
+        self.source = name
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.stop = stop
+        self.skip_invalid = skip_invalid
+
+    def _put(self, value: Any) -> bool:
+        while not self.stop.is_set():
+            try:
+                self.queue.put(value, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self) -> None:
+        opener = gzip.open if self.path.suffix == ".gz" else open
+        try:
+            with opener(self.path, "rt", encoding="utf-8") as f:
+                for line_no, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        item = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        if not self.skip_invalid:
+                            raise ValueError(f"{self.source}:{line_no} 不是合法的 JSON: {e}") from e
+                        logger.warning(f"跳过无效行 {self.source}:{line_no}: {e}")
+                        continue
+                    if not self._put((line_no, item)):
+                        return
+        except Exception as e:
+            self._put(e)
+            return
+        self._put(_END)
+
+
+class JsonlDataset:
+    """由多个 JSONL 文件（glob 匹配）组成的数据集
+
+    后台线程提前打开并解析接下来的 prefetch_files 个文件，解析结果放入有界缓冲区，
+    消费方（LLM worker）从单一迭代器取数据，不必等待打开文件和解析 JSON。
+    支持 .jsonl.gz 压缩文件。
+
+    - concat: 按文件名顺序依次输出每个文件的全部数据
+    - interleave: 在同时打开的文件之间轮流取 block_length 条（单个大文件不会独占输出）
+
+    每条数据附带来源（文件名和行号），写在 provenance_key 字段中。
+
+    用法:
+        dataset = JsonlDataset("parts/*.jsonl", data_dir="data/input", mode="interleave")
+        for item in dataset:
+            print(item["_source"])  # {"file": "parts/part-0001.jsonl", "line": 42}
+    """
+
+    def __init__(
+        self,
+        pattern: Union[str, List[str]],
+        data_dir: str = ".",
+        mode: str = "concat",
+        prefetch_files: int = 4,
+        buffer_size: int = 1000,
+        block_length: int = 1,
+        provenance_key: Optional[str] = "_source",
+        skip_invalid: bool = False,
+    ):
+        """
+        Args:
+            pattern: 相对 data_dir 的 glob 模式（支持 **），或多个模式
+            data_dir: 数据目录
+            mode: concat（顺序拼接）/ interleave（轮流交错）
+            prefetch_files: 同时在后台读取的文件数
+            buffer_size: 每个文件的预读缓冲条数（内存上限约为 prefetch_files × buffer_size 条）
+            block_length: interleave 模式下每个文件每轮输出的条数
+            provenance_key: 来源信息写入的字段名，None 表示不添加
+            skip_invalid: 是否跳过无法解析的行（默认抛出异常）
+        """
+        if mode not in ("concat", "interleave"):
+            raise ValueError(f"不支持的模式: {mode}，可选 concat / interleave")
+
+        self.data_dir = Path(data_dir)
+        patterns = [pattern] if isinstance(pattern, str) else list(pattern)
+        files = set()
+        for p in patterns:
+            files.update(glob.glob(str(self.data_dir / p), recursive=True))
+        self.files = sorted(Path(f) for f in files if Path(f).is_file())
+        if not self.files:
+            raise FileNotFoundError(f"没有匹配 {patterns} 的文件（data_dir={self.data_dir}）")
+
+        self.mode = mode
+        self.prefetch_files = max(1, prefetch_files)
+        self.buffer_size = buffer_size
+        self.block_length = block_length
+        self.provenance_key = provenance_key
+        self.skip_invalid = skip_invalid
+
+        self.items = 0
+        self.files_done = 0
+        self.wait_time = 0.0
+
+    def __len__(self) -> int:
+        """文件数"""
+        return len(self.files)
+
+    def _source_name(self, path: Path) -> str:
+        try:
+            return str(path.relative_to(self.data_dir))
+        except ValueError:
+            return str(path)
+
+    def _next(self, reader: _FileReader) -> Any:
+        """从文件读取队列中取一条，记录消费方的等待时间"""
+        try:
+            return reader.queue.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            value = reader.queue.get()
+            self.wait_time += time.perf_counter() - start
+            return value
+
+    def _emit(self, reader: _FileReader, line_no: int, item: Any) -> Any:
+        self.items += 1
+        if self.provenance_key is not None and isinstance(item, dict):
+            item[self.provenance_key] = {"file": reader.source, "line": line_no}
+        return item
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        stop = threading.Event()
+        pending = deque(self.files)
+        active: Deque[_FileReader] = deque()
+
+        def start_next() -> None:
+            path = pending.popleft()
+            reader = _FileReader(path, self._source_name(path), self.buffer_size, stop, self.skip_invalid)
+            reader.start()
+            active.append(reader)
+
+        self.items = self.files_done = 0
+        self.wait_time = 0.0
+        try:
+            while pending and len(active) < self.prefetch_files:
+                start_next()
+
+            while active:
+                reader = active[0]
+                # concat 读完当前文件再换下一个；interleave 每次取 block_length 条后轮换
+                count = 0
+                while self.mode == "concat" or count < self.block_length:
+                    value = self._next(reader)
+                    if value is _END:
+                        break
+                    if isinstance(value, Exception):
+                        raise value
+                    count += 1
+                    yield self._emit(reader, *value)
+                else:
+                    active.rotate(-1)
+                    continue
+
+                active.remove(reader)
+                self.files_done += 1
+                if pending:
+                    start_next()
+        finally:
+            stop.set()
+            for reader in active:
+                reader.join(timeout=1.0)
+            logger.info(
+                f"数据集读取结束: {self.files_done}/{len(self.files)} 个文件，{self.items} 条，"
+                f"等待 I/O {self.wait_time:.2f}s"
+            )
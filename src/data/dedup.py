@@ -0,0 +1,187 @@
+"""输入去重与结果回填"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+
+def normalize_text(text: str) -> str:
+    """文本归一化：Unicode NFKC、合并空白、去掉首尾空白"""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def payload_key(messages: List[Dict[str, Any]], **params) -> str:
+    """计算请求内容的去重键
+
+    对渲染后的消息做归一化后取 SHA-256，相同语义的请求得到相同的键。
+
+    Args:
+        messages: 渲染后的消息列表
+        **params: 其他影响结果的请求参数（如 temperature、model）
+
+    Returns:
+        十六进制哈希串
+    """
+    normalized = [
+        {
+            **m,
+            "content": normalize_text(m["content"]) if isinstance(m.get("content"), str) else m.get("content"),
+        }
+        for m in messages
+    ]
+    raw = json.dumps(
+        {"messages": normalized, "params": params},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Deduplicator:
+    """基于磁盘哈希索引的去重器
+
+    索引存放在 SQLite 文件中，内存占用有上限，可处理大于内存的输入。
+    典型流程：
+
+        dedup = Deduplicator("data/cache/dedup.sqlite", key_fn)
+        for key, item in dedup.unique(loader.iter_jsonl("input.jsonl")):
+            dedup.store(key, {"result": ..., "status": "success"})
+        results = list(dedup.fan_out(loader.iter_jsonl("input.jsonl")))
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        key_fn: Callable[[Dict[str, Any]], str],
+        reset: bool = True,
+        cache_size_mb: int = 64,
+        commit_every: int = 1000,
+    ):
+        """
+        Args:
+            index_path: 索引文件路径
+            key_fn: 从数据项计算去重键的函数（通常基于 payload_key）
+            reset: 是否清空已有索引
+            cache_size_mb: SQLite 页缓存上限（MB）
+            commit_every: 每写入多少条提交一次
+        """
+        self.index_path = Path(index_path)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.key_fn = key_fn
+        self.commit_every = commit_every
+
+        self.total = 0
+        self.unique_count = 0
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        self._conn.execute(f"PRAGMA cache_size = -{cache_size_mb * 1024}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        if reset:
+            self._conn.execute("DROP TABLE IF EXISTS payloads")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS payloads ("
+            "key TEXT PRIMARY KEY, count INTEGER NOT NULL DEFAULT 1, result TEXT)"
+        )
+        self._conn.commit()
+
+    def _maybe_commit(self) -> None:
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._conn.commit()
+            self._pending = 0
+
+    def unique(self, items: Iterable[Dict[str, Any]]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """流式产出每个唯一请求的首条数据
+
+        Args:
+            items: 输入数据（可以是迭代器）
+
+        Yields:
+            (去重键, 数据项)
+        """
+        for item in items:
+            key = self.key_fn(item)
+            with self._lock:
+                self.total += 1
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO payloads (key) VALUES (?)", (key,)
+                )
+                is_new = cursor.rowcount == 1
+                if not is_new:
+                    self._conn.execute(
+                        "UPDATE payloads SET count = count + 1 WHERE key = ?", (key,)
+                    )
+                self._maybe_commit()
+            if is_new:
+                self.unique_count += 1
+                yield key, item
+
+        with self._lock:
+            self._conn.commit()
+        logger.info(f"去重完成: {self.total} 条数据 -> {self.unique_count} 个唯一请求")
+
+    def store(self, key: str, result: Dict[str, Any]) -> None:
+        """保存唯一请求的处理结果
+
+        Args:
+            key: 去重键
+            result: 需要回填到每条原始数据的字段（如 result、status、error）
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE payloads SET result = ? WHERE key = ?",
+                (json.dumps(result, ensure_ascii=False), key),
+            )
+            self._maybe_commit()
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        """查询去重键对应的结果，未处理时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM payloads WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def fan_out(self, items: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """把结果回填到每条原始数据（保留各自的 id 等字段）
+
+        Args:
+            items: 与 unique() 相同的输入数据（重新迭代一遍）
+
+        Yields:
+            合并了结果字段的数据项
+        """
+        with self._lock:
+            self._conn.commit()
+
+        for item in items:
+            result = self.lookup(self.key_fn(item))
+            if result is None:
+                yield {**item, "result": None, "status": "failed", "error": "未处理"}
+            else:
+                yield {**item, **result}
+
+    def close(self) -> None:
+        """提交并关闭索引"""
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,10 +1,12 @@
 """数据加载器"""
 import json
 from pathlib import Path
-from typing import Any, Dict, Iterator, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 from loguru import logger
 
+from .dataset import JsonlDataset
+
 
 class DataLoader:
     """数据加载工具类"""
@@ -40,23 +42,25 @@ class DataLoader:
 
     def save_jsonl(
         self,
-        data: List[Dict[str, Any]],
+        data: Iterable[Dict[str, Any]],
         file_path: str
     ) -> None:
         """保存为JSONL文件
 
         Args:
-            data: 数据列表
+            data: 数据列表，也可以是迭代器（边产出边写入，不在内存中汇总）
             file_path: 文件路径
         """
         file_path = self.data_dir / file_path
         file_path.parent.mkdir(parents=True, exist_ok=True)
 
+        count = 0
         with open(file_path, "w", encoding="utf-8") as f:
             for item in data:
                 f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                count += 1
 
-        logger.info(f"保存了 {len(data)} 条数据到 {file_path}")
+        logger.info(f"保存了 {count} 条数据到 {file_path}")
 
     def iter_jsonl(
         self,
@@ -79,3 +83,15 @@ class DataLoader:
                 if max_samples and i >= max_samples:
                     break
                 yield json.loads(line)
+
+    def iter_dataset(self, pattern: str, **kwargs) -> JsonlDataset:
+        """迭代 data_dir 下多个 JSONL 文件（后台预取，附带来源文件和行号）
+
+        Args:
+            pattern: glob 模式，如 "parts/*.jsonl" 或 "**/*.jsonl.gz"
+            **kwargs: JsonlDataset 的其他参数（mode、prefetch_files 等）
+
+        Returns:
+            可迭代的 JsonlDataset
+        """
+        return JsonlDataset(pattern, data_dir=str(self.data_dir), **kwargs)
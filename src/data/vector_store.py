@@ -0,0 +1,274 @@
+"""基于内存映射的向量存储"""
+import json
+import os
+from pathlib import Path
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖，只有使用 VectorStore 时才需要
+    np = None
+
+
+class VectorStore:
+    """内存映射的 NumPy 向量存储
+
+    第 i 行向量对应输入文件的第 i 行（与 DataLoader.iter_jsonl 的顺序一致），
+    数据在磁盘上，千万行也不需要全部读入内存；未写入的行在 filled 中标记为 False，
+    中断后可以只补算缺失的行。
+
+    目录结构:
+        vectors.npy  (capacity, dim) 向量
+        filled.npy   (capacity,) 是否已写入
+        meta.json    维度、数据类型等
+
+    用法:
+        store = VectorStore("data/cache/vectors", capacity=total_rows)
+        store.fill(((i, item["text"]) for i, item in enumerate(loader.iter_jsonl("input.jsonl"))), llm.embed)
+        ids, scores = store.search(llm.embed(["查询文本"])[0], k=10)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dim: Optional[int] = None,
+        capacity: int = 0,
+        dtype: str = "float32",
+        normalize: bool = True,
+    ):
+        """
+        Args:
+            path: 存储目录，已存在时打开，否则新建
+            dim: 向量维度，新建时为 None 则在第一次写入时确定
+            capacity: 初始行数，写入超出时自动扩容
+            dtype: 存储类型，float16 可减半磁盘和内存占用
+            normalize: 写入时归一化，search 的内积即余弦相似度
+        """
+        if np is None:
+            raise ImportError("VectorStore 需要 numpy，请运行: pip install numpy")
+
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.path / "meta.json"
+        self.vectors = None
+        self.filled = None
+
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            self.dim = meta["dim"]
+            self.dtype = np.dtype(meta["dtype"])
+            self.normalize = meta["normalize"]
+            self._open("r+")
+            logger.info(f"打开向量存储 {self.path}: {self.count()}/{len(self)} 行已写入")
+        else:
+            self.dim = dim
+            self.dtype = np.dtype(dtype)
+            self.normalize = normalize
+            self._capacity = capacity
+            if dim is not None:
+                self._create(capacity)
+
+    def _open(self, mode: str) -> None:
+        self.vectors = np.load(self.path / "vectors.npy", mmap_mode=mode)
+        self.filled = np.load(self.path / "filled.npy", mmap_mode=mode)
+
+    def _create(self, capacity: int) -> None:
+        """新建存储文件"""
+        self.vectors = np.lib.format.open_memmap(
+            self.path / "vectors.npy", mode="w+", dtype=self.dtype, shape=(capacity, self.dim)
+        )
+        self.filled = np.lib.format.open_memmap(
+            self.path / "filled.npy", mode="w+", dtype=bool, shape=(capacity,)
+        )
+        self.meta_path.write_text(
+            json.dumps({"dim": self.dim, "dtype": self.dtype.name, "normalize": self.normalize}),
+            encoding="utf-8",
+        )
+
+    def __len__(self) -> int:
+        return 0 if self.vectors is None else self.vectors.shape[0]
+
+    def count(self) -> int:
+        """已写入的行数"""
+        return 0 if self.filled is None else int(self.filled.sum())
+
+    def missing(self) -> "np.ndarray":
+        """尚未写入的行号"""
+        return np.flatnonzero(~self.filled) if self.filled is not None else np.arange(self._capacity)
+
+    def resize(self, capacity: int, chunk_rows: int = 1 << 20) -> None:
+        """扩容到 capacity 行（分块复制，不把整个文件读入内存）"""
+        old_vectors, old_filled = self.vectors, self.filled
+        rows = len(self)
+        if capacity <= rows:
+            return
+
+        tmp_vectors = self.path / "vectors.npy.tmp"
+        tmp_filled = self.path / "filled.npy.tmp"
+        vectors = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=self.dtype, shape=(capacity, self.dim))
+        filled = np.lib.format.open_memmap(tmp_filled, mode="w+", dtype=bool, shape=(capacity,))
+        for start in range(0, rows, chunk_rows):
+            end = min(start + chunk_rows, rows)
+            vectors[start:end] = old_vectors[start:end]
+            filled[start:end] = old_filled[start:end]
+        vectors.flush()
+        filled.flush()
+        del vectors, filled, old_vectors, old_filled
+        self.vectors = self.filled = None
+
+        os.replace(tmp_vectors, self.path / "vectors.npy")
+        os.replace(tmp_filled, self.path / "filled.npy")
+        self._open("r+")
+
+    def write(self, rows: Sequence[int], vectors: Sequence[Sequence[float]]) -> None:
+        """把向量写入指定行
+
+        Args:
+            rows: 行号（与输入文件的行号对齐）
+            vectors: 向量，与 rows 一一对应
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        rows = np.asarray(rows, dtype=np.int64)
+        if vectors.ndim != 2 or len(vectors) != len(rows):
+            raise ValueError(f"向量形状 {vectors.shape} 与行数 {len(rows)} 不一致")
+
+        if self.vectors is None:
+            self.dim = vectors.shape[1]
+            self._create(max(self._capacity, int(rows.max()) + 1))
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"向量维度 {vectors.shape[1]} 与存储维度 {self.dim} 不一致")
+
+        needed = int(rows.max()) + 1
+        if needed > len(self):
+            self.resize(max(needed, len(self) * 2))
+
+        if self.normalize:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+        self.vectors[rows] = vectors.astype(self.dtype, copy=False)
+        self.filled[rows] = True
+
+    def get(self, rows: Sequence[int]) -> "np.ndarray":
+        """读取指定行的向量"""
+        return np.asarray(self.vectors[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    def fill(
+        self,
+        rows: Iterable[Tuple[int, str]],
+        embed_fn: Callable[[List[str]], List[List[float]]],
+        batch_rows: int = 1024,
+        flush_every: int = 100_000,
+    ) -> int:
+        """为 (行号, 文本) 计算向量并写入，已写入的行跳过
+
+        Args:
+            rows: (行号, 文本) 迭代器，通常由 enumerate(loader.iter_jsonl(...)) 构造
+            embed_fn: 批量计算向量的函数（如 llm.embed，内部再按 provider 上限分批并发）
+            batch_rows: 每次交给 embed_fn 的行数
+            flush_every: 每写入多少行落盘一次
+
+        Returns:
+            本次写入的行数
+        """
+        written = since_flush = 0
+        batch_ids: List[int] = []
+        batch_texts: List[str] = []
+
+        def flush_batch() -> None:
+            nonlocal written, since_flush
+            self.write(batch_ids, embed_fn(batch_texts))
+            written += len(batch_ids)
+            since_flush += len(batch_ids)
+            batch_ids.clear()
+            batch_texts.clear()
+            if since_flush >= flush_every:
+                self.flush()
+                since_flush = 0
+                logger.info(f"已写入 {written} 行向量")
+
+        for row, text in rows:
+            if self.filled is not None and row < len(self) and self.filled[row]:
+                continue
+            batch_ids.append(row)
+            batch_texts.append(text)
+            if len(batch_ids) >= batch_rows:
+                flush_batch()
+        if batch_ids:
+            flush_batch()
+
+        self.flush()
+        return written
+
+    def search(
+        self,
+        queries: Sequence[float],
+        k: int = 10,
+        chunk_rows: int = 1 << 18,
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """向量化 top-k 相似度检索（内积；写入时已归一化则为余弦相似度）
+
+        按块扫描存储，每块一次矩阵乘法并用 argpartition 取块内 top-k，
+        内存占用与块大小成正比，与总行数无关。
+
+        Args:
+            queries: 单个查询向量 (dim,) 或一批查询 (q, dim)
+            k: 返回的结果数
+            chunk_rows: 每块行数
+
+        Returns:
+            (行号, 相似度)，按相似度从高到低排列；单个查询时为一维数组
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+        if self.normalize:
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        n_queries = len(queries)
+        best_ids = np.full((n_queries, 0), -1, dtype=np.int64)
+        best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+
+        for start in range(0, len(self), chunk_rows):
+            end = min(start + chunk_rows, len(self))
+            block = np.asarray(self.vectors[start:end], dtype=np.float32)
+            scores = queries @ block.T  # (q, rows)
+            scores[:, ~self.filled[start:end]] = -np.inf
+
+            top = min(k, end - start)
+            idx = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+            best_ids = np.concatenate([best_ids, idx + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, idx, axis=1)], axis=1)
+
+            # 只保留当前的 top-k，与下一块合并
+            if best_ids.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_ids = np.take_along_axis(best_ids, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+        # 已写入的行不足 k 时去掉填充的结果
+        valid = np.isfinite(best_scores).all(axis=0)
+        best_ids, best_scores = best_ids[:, valid], best_scores[:, valid]
+        return (best_ids[0], best_scores[0]) if single else (best_ids, best_scores)
+
+    def flush(self) -> None:
+        """把修改写回磁盘"""
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.filled.flush()
+
+    def close(self) -> None:
+        """落盘并释放内存映射"""
+        self.flush()
+        self.vectors = self.filled = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
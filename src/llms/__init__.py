@@ -1,14 +1,32 @@
 """LLM模块"""
 from .base import BaseLLM
+from .deadline import Deadline, DeadlineExceeded
 from .volcengine_llm import VolcEngineLLM
 from .azure_llm import AzureLLM
 from .custom_llm import CustomLLM
 from .aliyun_llm import AliyunLLM
+from .tracing import Tracer, tracer
+from .transport import RequestsTransport, HTTP2Transport, create_transport
+from .context_cache import ContextCacheManager, order_for_prefix_cache
+from .cassette import CassetteMiss, RecordReplayTransport
+from .conversation import Conversation
 
 __all__ = [
     "BaseLLM",
+    "Deadline",
+    "DeadlineExceeded",
     "VolcEngineLLM",
     "AzureLLM",
     "CustomLLM",
     "AliyunLLM",
+    "Tracer",
+    "tracer",
+    "RequestsTransport",
+    "HTTP2Transport",
+    "create_transport",
+    "ContextCacheManager",
+    "order_for_prefix_cache",
+    "CassetteMiss",
+    "RecordReplayTransport",
+    "Conversation",
 ]
@@ -1,13 +1,18 @@
 """阿里云通义千问 LLM"""
 import os
 import requests
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from .base import BaseLLM
+from .deadline import Deadline
+from .transport import RequestsTransport
 
 
 class AliyunLLM(BaseLLM):
     """阿里云通义千问大模型服务封装（DashScope API）"""
 
+    # DashScope text-embedding-v3 单次请求最多 10 条文本
+    max_embed_batch = 10
+
     def __init__(
         self,
         model: Optional[str] = None,
@@ -16,6 +21,9 @@ class AliyunLLM(BaseLLM):
         temperature: float = 0.01,
         max_tokens: int = 2048,
         timeout: int = 60,
+        connect_timeout: float = 10,
+        embedding_model: Optional[str] = None,
+        transport=None,
     ):
         # 优先用传入参数，其次用环境变量
         self.api_key = api_key or os.getenv("ALIYUN_API_KEY")
@@ -25,6 +33,10 @@ class AliyunLLM(BaseLLM):
         )
         model = model or os.getenv("ALIYUN_MODEL_NAME", "qwen-plus")
         self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.embedding_model = embedding_model or os.getenv("ALIYUN_EMBEDDING_MODEL", "text-embedding-v3")
+        # HTTP 传输层（可替换为 HTTP2Transport 等），默认 requests
+        self.transport = transport or RequestsTransport()
 
         if not self.api_key:
             raise ValueError("ALIYUN_API_KEY is not set in env or passed in.")
@@ -32,6 +44,9 @@ class AliyunLLM(BaseLLM):
         # 标准 chat/completions 接口（兼容 OpenAI 格式）
         self.chat_url = f"{self.base_url.rstrip('/')}/chat/completions"
 
+        # 向量接口（兼容 OpenAI 格式）
+        self.embeddings_url = f"{self.base_url.rstrip('/')}/embeddings"
+
         super().__init__(model=model, temperature=temperature, max_tokens=max_tokens)
 
     def chat(
@@ -40,6 +55,7 @@ class AliyunLLM(BaseLLM):
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
         top_p: float = 0.8,
+        deadline: Optional[Union[float, Deadline]] = None,
         **kwargs
     ) -> str:
         """
@@ -50,6 +66,7 @@ class AliyunLLM(BaseLLM):
             temperature: 温度参数，范围 [0, 2]
             max_tokens: 最大token数
             top_p: 核采样参数，范围 [0, 1]
+            deadline: 截止时间（Deadline 或剩余秒数），已过期则不发送
             **kwargs: 其他参数（如 stop、presence_penalty 等）
 
         Returns:
@@ -76,11 +93,39 @@ class AliyunLLM(BaseLLM):
             "Authorization": f"Bearer {self.api_key}",
         }
 
-        data = self._make_request(payload, headers)
-        try:
-            return data["choices"][0]["message"]["content"]
-        except (KeyError, IndexError, TypeError) as e:
-            raise RuntimeError(f"Unexpected response format: {data}") from e
+        data = self._make_request(payload, headers, deadline=deadline)
+        return self._parse_response(data)
+
+    @staticmethod
+    def with_cache_control(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        为前缀消息打上显式缓存标记（cache_control）
+
+        DashScope 以最后一条带 cache_control 的消息为界创建显式缓存，
+        命中后缓存有效期自动续期；不支持显式缓存的模型会忽略该字段，
+        仍可依赖相同前缀的隐式缓存。
+
+        Args:
+            messages: 前缀消息列表
+
+        Returns:
+            新的消息列表（不修改原列表）
+        """
+        marked = [dict(m) for m in messages]
+        if not marked:
+            return marked
+
+        last = marked[-1]
+        content = last.get("content")
+        if isinstance(content, str):
+            last["content"] = [
+                {"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}
+            ]
+        elif isinstance(content, list) and content:
+            blocks = [dict(b) for b in content]
+            blocks[-1]["cache_control"] = {"type": "ephemeral"}
+            last["content"] = blocks
+        return marked
 
     def get_available_models(self) -> List[Dict[str, Any]]:
         """获取阿里云可用的模型列表"""
@@ -117,32 +162,39 @@ class AliyunLLM(BaseLLM):
             for var, value in original_proxies.items():
                 os.environ[var] = value
 
+    def _embed_batch(
+        self,
+        texts: List[str],
+        model: str,
+        deadline: Optional[Deadline] = None,
+    ) -> List[List[float]]:
+        """调用 embeddings 接口计算一批向量"""
+        payload: Dict[str, Any] = {
+            "model": model,
+            "input": texts,
+            "encoding_format": "float",
+        }
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+        data = self._make_request(payload, headers, url=self.embeddings_url, deadline=deadline)
+        return self._parse_embeddings(data, len(texts))
+
     def _make_request(
         self,
         payload: Dict[str, Any],
         headers: Dict[str, str],
+        url: Optional[str] = None,
+        deadline: Optional[Union[float, Deadline]] = None,
     ) -> Dict[str, Any]:
-        """通用请求方法，禁用代理以避免连接问题"""
-        # 保存原始环境变量
-        original_proxies = {}
-        proxy_vars = ['http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY', 'all_proxy', 'ALL_PROXY']
-        for var in proxy_vars:
-            if var in os.environ:
-                original_proxies[var] = os.environ[var]
-                del os.environ[var]
-
-        try:
-            # 设置 proxies 参数为空字典，确保不使用任何代理
-            resp = requests.post(
-                self.chat_url,
-                headers=headers,
-                json=payload,
-                timeout=self.timeout,
-                proxies={},  # 空字典表示不使用代理
-            )
-            resp.raise_for_status()
-            return resp.json()
-        finally:
-            # 恢复原始环境变量
-            for var, value in original_proxies.items():
-                os.environ[var] = value
+        """通用请求方法，经由传输层发送（默认禁用代理的 requests）"""
+        # 连接/读取超时从截止时间中扣除，已过期时直接抛出 DeadlineExceeded
+        return self.transport.post(
+            url or self.chat_url,
+            headers=headers,
+            payload=payload,
+            timeout=self._request_timeout(deadline),
+        )
@@ -1,13 +1,17 @@
 """Azure OpenAI LLM"""
 import os
-import requests
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from .base import BaseLLM
+from .deadline import Deadline
+from .transport import RequestsTransport
 
 
 class AzureLLM(BaseLLM):
     """Azure OpenAI 大模型服务封装"""
 
+    # Azure OpenAI embeddings 单次请求最多 2048 条文本
+    max_embed_batch = 2048
+
     def __init__(
         self,
         model: Optional[str] = None,
@@ -17,6 +21,9 @@ class AzureLLM(BaseLLM):
         temperature: float = 0.01,
         max_tokens: int = 2048,
         timeout: int = 60,
+        connect_timeout: float = 10,
+        embedding_model: Optional[str] = None,
+        transport=None,
     ):
         # 优先用传入参数，其次用环境变量
         self.api_key = api_key or os.getenv("AZURE_API_KEY")
@@ -24,6 +31,10 @@ class AzureLLM(BaseLLM):
         self.api_version = api_version or os.getenv("AZURE_API_VERSION", "2025-01-01-preview")
         model = model or os.getenv("AZURE_DEPLOYED_MODELS")
         self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.embedding_model = embedding_model or os.getenv("AZURE_EMBEDDING_DEPLOYMENT")
+        # HTTP 传输层（可替换为 HTTP2Transport 等），默认 requests
+        self.transport = transport or RequestsTransport()
 
         if not self.api_key:
             raise ValueError("AZURE_API_KEY is not set in env or passed in.")
@@ -39,6 +50,7 @@ class AzureLLM(BaseLLM):
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
+        deadline: Optional[Union[float, Deadline]] = None,
         **kwargs
     ) -> str:
         """
@@ -48,6 +60,7 @@ class AzureLLM(BaseLLM):
             messages: 消息列表，格式与 OpenAI 一致
             temperature: 温度参数，范围 [0, 2]
             max_tokens: 最大token数
+            deadline: 截止时间（Deadline 或剩余秒数），已过期则不发送
             **kwargs: 其他参数（如 top_p、stop、presence_penalty 等）
 
         Returns:
@@ -80,39 +93,47 @@ class AzureLLM(BaseLLM):
             "api-key": self.api_key,
         }
 
-        data = self._make_request(chat_url, payload, headers)
-        try:
-            return data["choices"][0]["message"]["content"]
-        except (KeyError, IndexError, TypeError) as e:
-            raise RuntimeError(f"Unexpected response format: {data}") from e
+        data = self._make_request(chat_url, payload, headers, deadline=deadline)
+        return self._parse_response(data)
+
+    def _embed_batch(
+        self,
+        texts: List[str],
+        model: str,
+        deadline: Optional[Deadline] = None,
+    ) -> List[List[float]]:
+        """调用 embeddings 接口计算一批向量"""
+        # 模型即部署名，与 chat 相同
+        embeddings_url = (
+            f"{self.endpoint.rstrip('/')}/openai/deployments/{model}/"
+            f"embeddings?api-version={self.api_version}"
+        )
+
+        payload: Dict[str, Any] = {
+            "input": texts,
+            "encoding_format": "float",
+        }
+
+        headers = {
+            "Content-Type": "application/json",
+            "api-key": self.api_key,
+        }
+
+        data = self._make_request(embeddings_url, payload, headers, deadline=deadline)
+        return self._parse_embeddings(data, len(texts))
 
     def _make_request(
         self,
         url: str,
         payload: Dict[str, Any],
         headers: Dict[str, str],
+        deadline: Optional[Union[float, Deadline]] = None,
     ) -> Dict[str, Any]:
-        """通用请求方法，禁用代理以避免连接问题"""
-        # 保存原始环境变量
-        original_proxies = {}
-        proxy_vars = ['http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY', 'all_proxy', 'ALL_PROXY']
-        for var in proxy_vars:
-            if var in os.environ:
-                original_proxies[var] = os.environ[var]
-                del os.environ[var]
-
-        try:
-            # 设置 proxies 参数为空字典，确保不使用任何代理
-            resp = requests.post(
-                url,
-                headers=headers,
-                json=payload,
-                timeout=self.timeout,
-                proxies={},  # 空字典表示不使用代理
-            )
-            resp.raise_for_status()
-            return resp.json()
-        finally:
-            # 恢复原始环境变量
-            for var, value in original_proxies.items():
-                os.environ[var] = value
+        """通用请求方法，经由传输层发送（默认禁用代理的 requests）"""
+        # 连接/读取超时从截止时间中扣除，已过期时直接抛出 DeadlineExceeded
+        return self.transport.post(
+            url,
+            headers=headers,
+            payload=payload,
+            timeout=self._request_timeout(deadline),
+        )
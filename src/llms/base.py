@@ -1,11 +1,18 @@
 """LLM基类"""
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .deadline import Deadline
 
 
 class BaseLLM(ABC):
     """LLM基类"""
 
+    # 单次 /embeddings 请求最多包含的文本条数（各 provider 按服务端限制覆盖）
+    max_embed_batch = 64
+
     def __init__(
         self,
         model: str,
@@ -15,6 +22,8 @@ class BaseLLM(ABC):
         self.model = model
         self.temperature = temperature
         self.max_tokens = max_tokens
+        # 每个线程最近一次调用的 usage / finish_reason（chat 只返回文本）
+        self._local = threading.local()
 
     @abstractmethod
     def chat(
@@ -22,6 +31,7 @@ class BaseLLM(ABC):
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
+        deadline: Optional[Union[float, Deadline]] = None,
         **kwargs
     ) -> str:
         """聊天接口
@@ -30,12 +40,114 @@ class BaseLLM(ABC):
             messages: 消息列表
             temperature: 温度参数
             max_tokens: 最大token数
+            deadline: 截止时间（Deadline 或剩余秒数），连接/读取超时从中扣除，已过期则不发送
 
         Returns:
             生成的文本
         """
         pass
 
+    def _parse_response(self, data: Dict[str, Any]) -> str:
+        """从 chat/completions 响应中取出文本，并记录本线程最近一次调用的元信息"""
+        try:
+            choice = data["choices"][0]
+            content = choice["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise RuntimeError(f"Unexpected response format: {data}") from e
+
+        self._local.response = {
+            "usage": data.get("usage") or {},
+            "finish_reason": choice.get("finish_reason"),
+        }
+        return content
+
+    def last_response(self) -> Dict[str, Any]:
+        """当前线程最近一次 chat 调用的元信息
+
+        Returns:
+            {"usage": {...}, "finish_reason": "stop" | "length" | ...}，尚未调用时为空字典
+        """
+        return getattr(self._local, "response", {})
+
+    def embed(
+        self,
+        texts: List[str],
+        model: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        max_workers: int = 4,
+        deadline: Optional[Union[float, Deadline]] = None,
+    ) -> List[List[float]]:
+        """批量计算文本向量
+
+        按 provider 的单次请求上限自动分批，多个批次并发请求，结果与输入顺序一致。
+
+        Args:
+            texts: 文本列表
+            model: embedding 模型，默认使用实例的 embedding_model
+            batch_size: 每批条数，不超过 max_embed_batch
+            max_workers: 并发请求的批次数
+            deadline: 截止时间（Deadline 或剩余秒数），所有批次共享
+
+        Returns:
+            向量列表
+        """
+        model = model or getattr(self, "embedding_model", None)
+        if not model:
+            raise ValueError(f"{type(self).__name__} 未配置 embedding 模型")
+        texts = list(texts)
+        if not texts:
+            return []
+
+        size = min(batch_size or self.max_embed_batch, self.max_embed_batch)
+        batches = [texts[i:i + size] for i in range(0, len(texts), size)]
+        deadline = Deadline.coerce(deadline)
+        if len(batches) == 1 or max_workers <= 1:
+            results = [self._embed_batch(batch, model, deadline) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+                results = list(executor.map(lambda batch: self._embed_batch(batch, model, deadline), batches))
+        return [vector for result in results for vector in result]
+
+    def _embed_batch(
+        self,
+        texts: List[str],
+        model: str,
+        deadline: Optional[Deadline] = None,
+    ) -> List[List[float]]:
+        """请求一批向量（由支持 /embeddings 的 provider 实现）"""
+        raise NotImplementedError(f"{type(self).__name__} 不支持 embeddings")
+
+    @staticmethod
+    def _parse_embeddings(data: Dict[str, Any], expected: int) -> List[List[float]]:
+        """从 /embeddings 响应中按 index 顺序取出向量"""
+        try:
+            items = sorted(data["data"], key=lambda item: item["index"])
+            vectors = [item["embedding"] for item in items]
+        except (KeyError, TypeError) as e:
+            raise RuntimeError(f"Unexpected response format: {data}") from e
+        if len(vectors) != expected:
+            raise RuntimeError(f"返回了 {len(vectors)} 个向量，预期 {expected} 个")
+        return vectors
+
+    def _request_timeout(
+        self,
+        deadline: Optional[Union[float, Deadline]] = None,
+    ) -> Tuple[float, float]:
+        """计算本次请求的 (连接超时, 读取超时)
+
+        Args:
+            deadline: 截止时间，为 None 时使用实例的固定超时
+
+        Returns:
+            可直接传给 requests 的 timeout 参数
+        """
+        connect = getattr(self, "connect_timeout", 10)
+        read = getattr(self, "timeout", 60)
+        deadline = Deadline.coerce(deadline)
+        if deadline is None:
+            return connect, read
+        return deadline.timeouts(connect, read)
+
     def __call__(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """支持直接调用"""
         return self.chat(messages, **kwargs)
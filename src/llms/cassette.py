@@ -0,0 +1,290 @@
+"""请求录制与回放（离线复现、客户端基准测试）"""
+import atexit
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from loguru import logger
+
+from src.data.dedup import payload_key
+
+from .tracing import tracer
+from .transport import Timeout, http_error
+
+MODES = ("record", "replay", "auto")
+
+
+class CassetteMiss(LookupError):
+    """回放模式下磁带中没有对应的请求"""
+
+
+def request_key(url: str, payload: Dict[str, Any]) -> str:
+    """请求的回放键：地址 + 归一化后的请求体（不含请求头，密钥变化不影响回放）"""
+    params = {k: v for k, v in payload.items() if k != "messages"}
+    return payload_key(payload.get("messages", []), url=url, **params)
+
+
+class Cassette:
+    """带索引的磁带文件
+
+    记录为 JSONL，每行一对请求/响应；索引（回放键 -> [(偏移, 长度)]）保存在
+    同名 .idx 文件中，打开时只读索引，记录在回放时按偏移读取，不常驻内存
+    （需要纯内存回放时调用 preload()）。
+    索引落后于磁带时（如进程被杀）从索引记录的位置继续扫描补齐，
+    末尾写了一半的记录会被截掉，之后追加的记录从完整记录之后开始。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 磁带文件路径
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self.path.touch(exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[Tuple[int, int]]] = {}
+        # 只有 preload() 会填充，长时间录制时内存不随记录数增长
+        self._records: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        # 同一回放键录制了多次时（如 temperature > 0），按录制顺序轮流回放
+        self._cursor: Dict[str, int] = {}
+        self._indexed_size = 0
+        self._dirty = False
+
+        self._load_index()
+        self._writer = open(self.path, "ab")
+        self._reader = os.open(self.path, os.O_RDONLY)
+
+    def _load_index(self) -> None:
+        size = self.path.stat().st_size
+        if self.index_path.exists():
+            try:
+                data = json.loads(self.index_path.read_text(encoding="utf-8"))
+                if data["size"] <= size:
+                    self._index = {k: [tuple(e) for e in v] for k, v in data["entries"].items()}
+                    self._indexed_size = data["size"]
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                logger.warning(f"磁带索引损坏，重新建立: {e}")
+                self._index, self._indexed_size = {}, 0
+
+        if self._indexed_size < size:
+            self._scan(self._indexed_size)
+        if self._indexed_size < size:
+            # 末尾是写了一半的记录：截掉，否则新记录会接在半截内容之后，与索引的偏移对不上
+            logger.warning(f"截掉磁带末尾不完整的记录: {size - self._indexed_size} 字节")
+            with open(self.path, "r+b") as f:
+                f.truncate(self._indexed_size)
+
+    def _scan(self, start: int) -> None:
+        """从 start 开始扫描磁带，补齐索引"""
+        offset = start
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 写了一半的记录
+                try:
+                    key = json.loads(line)["key"]
+                except (json.JSONDecodeError, KeyError):
+                    logger.warning(f"跳过损坏的磁带记录: 偏移 {offset}")
+                else:
+                    self._index.setdefault(key, []).append((offset, len(line)))
+                offset += len(line)
+        self._indexed_size = offset
+        self._dirty = True
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._index.values())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """取出回放键对应的下一条记录，不存在返回 None"""
+        with self._lock:
+            entries = self._index.get(key)
+            if not entries:
+                return None
+            n = self._cursor.get(key, 0)
+            self._cursor[key] = n + 1
+            entry = entries[n % len(entries)]
+            record = self._records.get(entry)
+        if record is None:
+            offset, length = entry
+            record = json.loads(os.pread(self._reader, length, offset))
+        return record
+
+    def preload(self) -> None:
+        """把所有记录读入内存，回放时不再有磁盘 I/O"""
+        with self._lock:
+            for entries in self._index.values():
+                for offset, length in entries:
+                    if (offset, length) not in self._records:
+                        self._records[(offset, length)] = json.loads(os.pread(self._reader, length, offset))
+
+    def append(self, record: Dict[str, Any]) -> None:
+        """追加一条记录"""
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            offset = self._indexed_size
+            self._writer.write(line)
+            self._writer.flush()
+            entry = (offset, len(line))
+            self._index.setdefault(record["key"], []).append(entry)
+            self._indexed_size += len(line)
+            self._dirty = True
+
+    def save_index(self) -> None:
+        """把索引写回磁盘（先写临时文件再替换，避免写一半）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp = self.index_path.with_name(self.index_path.name + ".tmp")
+            tmp.write_text(
+                json.dumps({"size": self._indexed_size, "entries": self._index}),
+                encoding="utf-8",
+            )
+            os.replace(tmp, self.index_path)
+            self._dirty = False
+
+    def close(self) -> None:
+        """保存索引并关闭文件"""
+        if self._writer.closed:
+            return
+        self.save_index()
+        self._writer.close()
+        os.close(self._reader)
+
+
+# 同一磁带文件在进程内只打开一次，多个 LLM 实例共享
+_cassettes: Dict[str, Cassette] = {}
+_cassettes_lock = threading.Lock()
+
+
+def open_cassette(path: str) -> Cassette:
+    """打开（或复用已打开的）磁带，进程退出时自动保存索引"""
+    key = str(Path(path).resolve())
+    with _cassettes_lock:
+        if key not in _cassettes:
+            _cassettes[key] = Cassette(path)
+            atexit.register(_cassettes[key].close)
+        return _cassettes[key]
+
+
+class RecordReplayTransport:
+    """录制/回放传输，包装任意传输层
+
+    - record: 总是请求真实服务，并把请求/响应写入磁带
+    - replay: 只从磁带回放，找不到时抛出 CassetteMiss，不访问网络
+    - auto: 磁带中有则回放，没有则请求真实服务并录制
+
+    回放键是地址 + 归一化后的请求体，与请求头（API Key）无关。
+    latency_scale 控制回放速度：0 为内存速度，1 为按录制时的耗时回放，
+    耗时超过读取超时时与真实请求一样抛出 requests.Timeout。
+
+    用法:
+        transport = RecordReplayTransport("data/cache/run.cassette", inner=RequestsTransport())
+        llm = CustomLLM(..., transport=transport)
+    """
+
+    def __init__(
+        self,
+        cassette: str,
+        inner=None,
+        mode: str = "auto",
+        latency_scale: float = 0.0,
+    ):
+        """
+        Args:
+            cassette: 磁带文件路径
+            inner: 被包装的真实传输（record / auto 模式需要）
+            mode: record / replay / auto
+            latency_scale: 回放耗时相对录制耗时的倍数，0 表示不等待
+        """
+        if mode not in MODES:
+            raise ValueError(f"不支持的模式: {mode}，可选 {MODES}")
+        if mode != "replay" and inner is None:
+            raise ValueError(f"{mode} 模式需要提供真实传输 inner")
+        self.cassette = open_cassette(cassette)
+        self.inner = inner
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.hits = 0
+        self.misses = 0
+
+    def post(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        timeout: Timeout,
+    ) -> Dict[str, Any]:
+        """发送（或回放）POST 请求，参数同 RequestsTransport.post"""
+        key = request_key(url, payload)
+
+        if self.mode != "record":
+            record = self.cassette.get(key)
+            if record is not None:
+                self.hits += 1
+                return self._replay(url, record, timeout)
+            if self.mode == "replay":
+                self.misses += 1
+                raise CassetteMiss(f"磁带中没有该请求: {url} {key[:12]}")
+
+        self.misses += 1
+        return self._record(key, url, headers, payload, timeout)
+
+    def _replay(self, url: str, record: Dict[str, Any], timeout: Timeout) -> Dict[str, Any]:
+        with tracer.span("cassette_replay", status=record["status"]):
+            if self.latency_scale > 0:
+                delay = record["latency"] * self.latency_scale
+                read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+                if delay > read_timeout:
+                    time.sleep(read_timeout)
+                    raise requests.Timeout(f"回放耗时 {delay:.1f}s 超过读取超时 {read_timeout}s")
+                time.sleep(delay)
+        if record["status"] >= 400:
+            raise http_error(url, record["status"], record["body"].encode("utf-8"))
+        return record["response"]
+
+    def _record(
+        self,
+        key: str,
+        url: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        timeout: Timeout,
+    ) -> Dict[str, Any]:
+        start = time.perf_counter()
+        record = {"key": key, "url": url, "payload": payload, "recorded_at": time.time()}
+        try:
+            response = self.inner.post(url, headers=headers, payload=payload, timeout=timeout)
+        except requests.HTTPError as e:
+            # 服务端错误也录制，回放时同样抛出；超时、连接错误不录制
+            if e.response is not None:
+                self.cassette.append({
+                    **record,
+                    "status": e.response.status_code,
+                    "body": e.response.text,
+                    "latency": time.perf_counter() - start,
+                })
+            raise
+        self.cassette.append({
+            **record,
+            "status": 200,
+            "response": response,
+            "latency": time.perf_counter() - start,
+        })
+        return response
+
+    def close(self) -> None:
+        """保存磁带索引并关闭被包装的传输"""
+        self.cassette.save_index()
+        if self.inner is not None:
+            self.inner.close()
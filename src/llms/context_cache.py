@@ -0,0 +1,204 @@
+"""前缀上下文缓存管理"""
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+from loguru import logger
+
+from .base import BaseLLM
+
+# 上下文缓存已过期或不存在时服务端返回的错误码（Ark 的 error.code）
+CONTEXT_MISSING_CODES = ("ContextNotFound", "ContextExpired", "InvalidParameter.ContextId")
+
+
+def _error_code(error: requests.HTTPError) -> str:
+    """读取响应体中的 error.code，无法解析时返回空字符串"""
+    try:
+        body = error.response.json()
+    except ValueError:
+        return ""
+    err = body.get("error") if isinstance(body, dict) else None
+    if isinstance(err, dict):
+        return str(err.get("code") or "")
+    return ""
+
+
+def is_context_missing(error: BaseException) -> bool:
+    """判断异常是否表示 context_id 已过期或不存在（重建缓存后可重试）"""
+    if not isinstance(error, requests.HTTPError) or error.response is None:
+        return False
+    code = _error_code(error)
+    return any(code.startswith(c) for c in CONTEXT_MISSING_CODES)
+
+
+def is_permanent_error(error: BaseException) -> bool:
+    """创建缓存的失败是否为永久性的（不支持、鉴权失败、参数错误等 4xx）
+
+    超时、连接错误、429 和 5xx 视为暂时性失败。
+    """
+    if isinstance(error, requests.HTTPError):
+        if error.response is None:
+            return False
+        status = error.response.status_code
+        return 400 <= status < 500 and status not in (408, 429)
+    if isinstance(error, (requests.RequestException, TimeoutError, OSError)):
+        return False
+    # 响应格式不符等
+    return True
+
+
+def order_for_prefix_cache(
+    prefix_messages: List[Dict[str, Any]],
+    messages: List[Dict[str, Any]],
+) -> List[Dict[str, Any]]:
+    """按前缀缓存友好的顺序拼接消息
+
+    固定前缀放最前，随后是 messages 中的 system 消息，最后是其余消息
+    （各自保持原有相对顺序），保证不同请求之间的公共前缀尽可能长，
+    从而命中服务端的隐式前缀缓存。
+
+    Args:
+        prefix_messages: 所有请求共享的固定前缀
+        messages: 本次请求的消息
+
+    Returns:
+        拼接后的消息列表
+    """
+    system = [m for m in messages if m.get("role") == "system"]
+    others = [m for m in messages if m.get("role") != "system"]
+    return list(prefix_messages) + system + others
+
+
+class ContextCacheManager:
+    """前缀上下文缓存管理器
+
+    - VolcEngineLLM: 通过 Context API 创建服务端缓存，复用 context_id，临近过期前自动重建
+    - AliyunLLM: 为前缀打上 cache_control 显式缓存标记
+    - 其他 Provider: 把前缀放在消息最前，依赖服务端隐式前缀缓存
+
+    线程安全，可在批量处理的多个 worker 之间共享。
+    """
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        prefix_messages: List[Dict[str, Any]],
+        ttl: int = 3600,
+        refresh_margin: float = 300.0,
+        retry_delay: float = 30.0,
+        max_retry_delay: float = 600.0,
+    ):
+        """
+        Args:
+            llm: LLM实例
+            prefix_messages: 共享的固定前缀（通常是很长的 system prompt）
+            ttl: 服务端缓存有效期（秒）
+            refresh_margin: 距过期不足该秒数时提前重建缓存
+            retry_delay: 创建缓存暂时性失败后的初始退避时间（秒）
+            max_retry_delay: 最大退避时间（秒）
+        """
+        self.llm = llm
+        self.prefix_messages = list(prefix_messages)
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._lock = threading.Lock()
+        self._context_id: Optional[str] = None
+        self._expires_at = 0.0
+        # 显式缓存创建永久失败（如前缀过短、模型不支持）后退回隐式缓存
+        self._explicit_enabled = hasattr(llm, "create_context")
+        # 暂时性失败（超时、5xx）后退避，期间走隐式缓存，到期再尝试创建
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def get_context_id(self) -> Optional[str]:
+        """获取可用的 context_id，必要时创建或刷新
+
+        Returns:
+            context_id；不支持显式缓存时返回 None
+        """
+        if not self._explicit_enabled:
+            return None
+
+        with self._lock:
+            now = time.monotonic()
+            if self._context_id and now < self._expires_at - self.refresh_margin:
+                return self._context_id
+            if now < self._retry_at:
+                return None
+
+            try:
+                data = self.llm.create_context(self.prefix_messages, ttl=self.ttl)
+            except Exception as e:
+                self._context_id = None
+                if is_permanent_error(e):
+                    logger.warning(f"创建上下文缓存失败，退回隐式前缀缓存: {e}")
+                    self._explicit_enabled = False
+                    return None
+                delay = min(self.retry_delay * 2 ** self._failures, self.max_retry_delay)
+                self._failures += 1
+                self._retry_at = now + delay
+                logger.warning(f"创建上下文缓存暂时失败，{delay:.0f} 秒内使用隐式前缀缓存: {e}")
+                return None
+
+            self._failures = 0
+            self._context_id = data["id"]
+            self._expires_at = time.monotonic() + float(data.get("ttl") or self.ttl)
+            logger.info(f"已创建上下文缓存: {self._context_id}")
+            return self._context_id
+
+    def invalidate(self) -> None:
+        """丢弃当前缓存句柄，下次调用时重建"""
+        with self._lock:
+            self._context_id = None
+            self._expires_at = 0.0
+
+    def _touch(self, context_id: str) -> None:
+        """缓存每次使用后服务端重新计时"""
+        with self._lock:
+            if self._context_id == context_id:
+                self._expires_at = time.monotonic() + self.ttl
+
+    def build_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """构造不走显式 context_id 时的完整消息列表"""
+        prefix = self.prefix_messages
+        if hasattr(self.llm, "with_cache_control"):
+            prefix = self.llm.with_cache_control(prefix)
+        return order_for_prefix_cache(prefix, messages)
+
+    def chat(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        """在共享前缀之上发起对话
+
+        Args:
+            messages: 不含前缀的本次消息
+            **kwargs: 透传给 llm.chat 的参数
+
+        Returns:
+            生成的文本
+        """
+        context_id = self.get_context_id()
+        if context_id is None:
+            return self.llm.chat(self.build_messages(messages), **kwargs)
+
+        try:
+            result = self.llm.chat(messages, context_id=context_id, **kwargs)
+        except requests.HTTPError as e:
+            if not is_context_missing(e):
+                raise
+            # 缓存已在服务端过期，重建后重试一次
+            logger.warning(f"上下文缓存 {context_id} 不可用，重建后重试: {e}")
+            self.invalidate()
+            context_id = self.get_context_id()
+            if context_id is None:
+                return self.llm.chat(self.build_messages(messages), **kwargs)
+            result = self.llm.chat(messages, context_id=context_id, **kwargs)
+
+        self._touch(context_id)
+        return result
+
+    def __call__(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        """支持直接调用"""
+        return self.chat(messages, **kwargs)
@@ -0,0 +1,196 @@
+"""多轮对话的上下文窗口管理"""
+import re
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from loguru import logger
+
+SUMMARY_PROMPT = (
+    "你负责维护一段对话的摘要。请把【新增对话】中的关键信息（事实、结论、用户偏好、未完成的事项）"
+    "合并进【已有摘要】，输出更新后的完整摘要，不要输出其他内容。"
+)
+
+_CJK = re.compile(r"[　-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content or ""
+
+
+class Conversation:
+    """在 token 预算内管理多轮对话的历史
+
+    - 固定的 system 消息始终放在最前（同时有利于前缀缓存）
+    - 历史超出预算时从最早的轮次开始移出窗口，一次移到低水位，
+      避免之后每一轮都要移出、每一轮都要重新摘要
+    - 提供 summarizer 时，移出的轮次由 LLM 增量合并进一条摘要（只处理新移出的部分）
+
+    每轮请求的大小因此保持在预算内，不会随轮数线性增长。
+
+    用法:
+        conv = Conversation(llm, system="你是一个数据分析助手。", max_context_tokens=8000, summarizer=llm)
+        reply = conv.chat("帮我看看这份数据")
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        system: Union[str, List[Dict[str, Any]], None] = None,
+        max_context_tokens: int = 8000,
+        reserve_output_tokens: Optional[int] = None,
+        low_watermark: float = 0.6,
+        keep_recent: int = 2,
+        summarizer: Optional[Any] = None,
+        summary_max_tokens: int = 512,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        """
+        Args:
+            llm: LLM实例（也可以是 ContextCacheManager 等包装）
+            system: 固定的 system 提示（字符串或消息列表）
+            max_context_tokens: 模型的上下文长度
+            reserve_output_tokens: 为回复预留的 token 数，默认 llm.max_tokens
+            low_watermark: 超出预算后把历史裁剪到预算的该比例
+            keep_recent: 至少保留最近的多少条消息（即使超出预算），本轮的用户消息总会保留
+            summarizer: 用于生成摘要的 LLM（可以用更便宜的模型），None 表示直接丢弃旧轮次
+            summary_max_tokens: 摘要的最大长度
+            token_counter: 估计文本 token 数的函数
+        """
+        self.llm = llm
+        if isinstance(system, str):
+            system = [{"role": "system", "content": system}]
+        self.pinned: List[Dict[str, Any]] = list(system or [])
+        self.max_context_tokens = max_context_tokens
+        if reserve_output_tokens is None:
+            reserve_output_tokens = getattr(llm, "max_tokens", None) or 2048
+        self.budget = max_context_tokens - reserve_output_tokens
+        self.low_watermark = low_watermark
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer
+        self.summary_max_tokens = summary_max_tokens
+        self.count = token_counter
+
+        self.pinned_tokens = sum(self.count(_message_text(m)) for m in self.pinned)
+        if self.pinned_tokens >= self.budget:
+            raise ValueError(f"固定消息已占用 {self.pinned_tokens} tokens，超过预算 {self.budget}")
+
+        # 完整历史及每条消息的 token 数；window_start 之前的消息已移出窗口
+        self.history: List[Dict[str, Any]] = []
+        self._tokens: List[int] = []
+        self.window_start = 0
+        self.window_tokens = 0
+
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summaries = 0
+
+    def _add(self, message: Dict[str, Any]) -> None:
+        tokens = self.count(_message_text(message))
+        self.history.append(message)
+        self._tokens.append(tokens)
+        self.window_tokens += tokens
+
+    def _used(self) -> int:
+        return self.pinned_tokens + self.summary_tokens + self.window_tokens
+
+    def _evict(self) -> None:
+        """超出预算时把最早的消息移出窗口，直到低水位"""
+        if self._used() <= self.budget:
+            return
+
+        target = self.budget * self.low_watermark
+        # 本轮的用户消息始终保留
+        end = len(self.history) - max(1, self.keep_recent)
+        start = self.window_start
+        while self.window_start < end and self._used() > target:
+            self.window_tokens -= self._tokens[self.window_start]
+            self.window_start += 1
+        # 窗口从 user 消息开始，避免以孤立的 assistant 回复开头
+        while (self.window_start < end
+               and self.history[self.window_start].get("role") != "user"):
+            self.window_tokens -= self._tokens[self.window_start]
+            self.window_start += 1
+
+        if self.window_start > start and self.summarizer is not None:
+            self._summarize(self.history[start:self.window_start])
+
+    def _summarize(self, evicted: List[Dict[str, Any]]) -> None:
+        """把新移出窗口的消息增量合并进摘要"""
+        transcript = "\n".join(f"{m['role']}: {_message_text(m)}" for m in evicted)
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"【已有摘要】\n{self.summary or '（无）'}\n\n【新增对话】\n{transcript}"},
+        ]
+        try:
+            summary = self.summarizer.chat(messages, max_tokens=self.summary_max_tokens)
+        except Exception as e:
+            # 摘要失败不影响对话，本次移出的内容只是不进入摘要
+            logger.warning(f"生成对话摘要失败，已丢弃 {len(evicted)} 条旧消息: {e}")
+            return
+        self.summary = summary.strip()
+        self.summary_tokens = self.count(self.summary)
+        self.summaries += 1
+        logger.debug(f"对话摘要已更新（第 {self.summaries} 次，{self.summary_tokens} tokens）")
+
+    @property
+    def messages(self) -> List[Dict[str, Any]]:
+        """本轮实际发送的消息：固定消息 + 摘要 + 窗口内的历史"""
+        messages = list(self.pinned)
+        if self.summary:
+            messages.append({"role": "system", "content": f"以下是此前对话的摘要：\n{self.summary}"})
+        messages.extend(self.history[self.window_start:])
+        return messages
+
+    def chat(self, message: Union[str, Dict[str, Any]], **kwargs) -> str:
+        """发送一轮用户消息并记录回复
+
+        Args:
+            message: 用户消息（字符串或消息字典）
+            **kwargs: 透传给 llm.chat 的参数
+
+        Returns:
+            助手回复
+        """
+        if isinstance(message, str):
+            message = {"role": "user", "content": message}
+        self._add(message)
+        self._evict()
+
+        try:
+            reply = self.llm.chat(self.messages, **kwargs)
+        except Exception:
+            # 请求失败时撤回本轮用户消息，调用方可以重试同一轮
+            self.history.pop()
+            self.window_tokens -= self._tokens.pop()
+            raise
+
+        self._add({"role": "assistant", "content": reply})
+        return reply
+
+    def __call__(self, message: Union[str, Dict[str, Any]], **kwargs) -> str:
+        """支持直接调用"""
+        return self.chat(message, **kwargs)
+
+    def reset(self) -> None:
+        """清空历史和摘要（保留固定消息）"""
+        self.history, self._tokens = [], []
+        self.window_start = self.window_tokens = 0
+        self.summary, self.summary_tokens = "", 0
+
+    def stats(self) -> Dict[str, int]:
+        """历史条数、窗口内条数、预计本轮 prompt tokens 及摘要次数"""
+        return {
+            "history": len(self.history),
+            "window": len(self.history) - self.window_start,
+            "prompt_tokens": self._used(),
+            "budget": self.budget,
+            "summaries": self.summaries,
+        }
@@ -1,13 +1,17 @@
 """自定义 LLM API（支持任意 OpenAI 兼容的 API）"""
 import os
-import requests
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from .base import BaseLLM
+from .deadline import Deadline
+from .transport import RequestsTransport
 
 
 class CustomLLM(BaseLLM):
     """自定义 LLM API 封装（支持任意 OpenAI 兼容的 API）"""
 
+    # 服务端限制未知，取保守值
+    max_embed_batch = 64
+
     def __init__(
         self,
         model: Optional[str] = None,
@@ -16,7 +20,10 @@ class CustomLLM(BaseLLM):
         temperature: float = 0.01,
         max_tokens: int = 2048,
         timeout: int = 60,
+        connect_timeout: float = 10,
+        embedding_model: Optional[str] = None,
         verify_ssl: bool = True,
+        transport=None,
     ):
         # 优先用传入参数，其次用环境变量
         self.api_key = api_key or os.getenv("CUSTOM_API_KEY", "sk-your-api-key")
@@ -26,10 +33,14 @@ class CustomLLM(BaseLLM):
         )
         model = model or os.getenv("CUSTOM_MODEL_NAME", "qwen3-32b-w8a8")
         self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.embedding_model = embedding_model or os.getenv("CUSTOM_EMBEDDING_MODEL")
 
         # SSL 验证配置（对应 curl -k）
         verify_ssl_env = os.getenv("CUSTOM_VERIFY_SSL", "true").lower()
         self.verify_ssl = verify_ssl if verify_ssl is not None else (verify_ssl_env == "true")
+        # HTTP 传输层（可替换为 HTTP2Transport 等），默认 requests
+        self.transport = transport or RequestsTransport(verify=self.verify_ssl)
 
         if not self.base_url:
             raise ValueError("CUSTOM_BASE_URL is not set in env or passed in.")
@@ -39,6 +50,9 @@ class CustomLLM(BaseLLM):
         # 标准 chat/completions 接口（兼容 OpenAI 格式）
         self.chat_url = f"{self.base_url.rstrip('/')}/chat/completions"
 
+        # 向量接口（兼容 OpenAI 格式）
+        self.embeddings_url = f"{self.base_url.rstrip('/')}/embeddings"
+
         super().__init__(model=model, temperature=temperature, max_tokens=max_tokens)
 
     def chat(
@@ -46,6 +60,7 @@ class CustomLLM(BaseLLM):
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
+        deadline: Optional[Union[float, Deadline]] = None,
         **kwargs
     ) -> str:
         """
@@ -55,6 +70,7 @@ class CustomLLM(BaseLLM):
             messages: 消息列表，格式与 OpenAI 一致
             temperature: 温度参数
             max_tokens: 最大token数
+            deadline: 截止时间（Deadline 或剩余秒数），已过期则不发送
             **kwargs: 其他参数
 
         Returns:
@@ -79,38 +95,42 @@ class CustomLLM(BaseLLM):
             "Authorization": f"Bearer {self.api_key}",
         }
 
-        data = self._make_request(payload, headers)
-        try:
-            return data["choices"][0]["message"]["content"]
-        except (KeyError, IndexError, TypeError) as e:
-            raise RuntimeError(f"Unexpected response format: {data}") from e
+        data = self._make_request(payload, headers, deadline=deadline)
+        return self._parse_response(data)
+
+    def _embed_batch(
+        self,
+        texts: List[str],
+        model: str,
+        deadline: Optional[Deadline] = None,
+    ) -> List[List[float]]:
+        """调用 embeddings 接口计算一批向量"""
+        payload: Dict[str, Any] = {
+            "model": model,
+            "input": texts,
+            "encoding_format": "float",
+        }
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+        data = self._make_request(payload, headers, url=self.embeddings_url, deadline=deadline)
+        return self._parse_embeddings(data, len(texts))
 
     def _make_request(
         self,
         payload: Dict[str, Any],
         headers: Dict[str, str],
+        url: Optional[str] = None,
+        deadline: Optional[Union[float, Deadline]] = None,
     ) -> Dict[str, Any]:
-        """支持 SSL 验证配置的请求方法，禁用代理以避免连接问题"""
-        # 保存原始环境变量
-        original_proxies = {}
-        proxy_vars = ['http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY', 'all_proxy', 'ALL_PROXY']
-        for var in proxy_vars:
-            if var in os.environ:
-                original_proxies[var] = os.environ[var]
-                del os.environ[var]
-
-        try:
-            resp = requests.post(
-                self.chat_url,
-                headers=headers,
-                json=payload,
-                timeout=self.timeout,
-                proxies={},
-                verify=self.verify_ssl,  # 控制 SSL 验证（False = curl -k）
-            )
-            resp.raise_for_status()
-            return resp.json()
-        finally:
-            # 恢复原始环境变量
-            for var, value in original_proxies.items():
-                os.environ[var] = value
+        """通用请求方法，经由传输层发送（SSL 验证配置在传输层生效）"""
+        # 连接/读取超时从截止时间中扣除，已过期时直接抛出 DeadlineExceeded
+        return self.transport.post(
+            url or self.chat_url,
+            headers=headers,
+            payload=payload,
+            timeout=self._request_timeout(deadline),
+        )
@@ -0,0 +1,59 @@
+"""端到端截止时间"""
+import time
+from typing import Optional, Tuple, Union
+
+
+class DeadlineExceeded(TimeoutError):
+    """截止时间已过，请求未发送或不再重试"""
+
+
+class Deadline:
+    """单条数据的端到端时间预算
+
+    在排队、连接、读取和重试之间共享，各环节的超时都从剩余预算中扣除。
+    """
+
+    def __init__(self, budget: float):
+        """
+        Args:
+            budget: 从现在起的总预算（秒）
+        """
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def coerce(cls, deadline: Optional[Union[float, "Deadline"]]) -> Optional["Deadline"]:
+        """把秒数转换为 Deadline，None 和 Deadline 原样返回"""
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return cls(float(deadline))
+
+    def remaining(self) -> float:
+        """剩余预算（秒），可能为负"""
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        """是否已过截止时间"""
+        return self.remaining() <= 0
+
+    def check(self, what: str = "请求") -> None:
+        """已过截止时间时抛出 DeadlineExceeded"""
+        if self.expired():
+            raise DeadlineExceeded(f"{what}已超过截止时间（预算 {self.budget:.1f}s）")
+
+    def timeouts(self, connect: float, read: float) -> Tuple[float, float]:
+        """从剩余预算中分配连接与读取超时
+
+        Args:
+            connect: 连接超时上限
+            read: 读取超时上限
+
+        Returns:
+            (connect, read)，可直接传给 requests 的 timeout 参数
+        """
+        self.check()
+        remaining = self.remaining()
+        return min(connect, remaining), min(read, remaining)
+
+    def __repr__(self) -> str:
+        return f"Deadline(remaining={self.remaining():.2f}s)"
@@ -0,0 +1,186 @@
+"""热路径追踪（Chrome Trace / Perfetto 格式）"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Optional
+
+
+class _NullSpan:
+    """关闭追踪时使用的空 span，进入/退出均无开销"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._record(self.name, self.cat, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+    def set(self, **args) -> None:
+        """补充 span 参数（如状态码、字节数）"""
+        self.args.update(args)
+
+
+class Tracer:
+    """轻量级 span 记录器
+
+    默认关闭，关闭时 span() 返回共享的空对象，热路径上只有一次属性判断。
+    开启后在内存环形缓冲区中记录事件，可导出为 chrome://tracing / Perfetto 可读的 JSON。
+
+    用法:
+        tracer.enable()
+        with tracer.span("request", url=url):
+            ...
+        tracer.export_chrome_trace("logs/trace.json")
+    """
+
+    def __init__(self, max_events: int = 1_000_000):
+        """
+        Args:
+            max_events: 最多保留的事件数，超出后丢弃最早的事件
+        """
+        self.enabled = False
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self._origin = time.perf_counter_ns()
+        self._thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """开启追踪"""
+        self.enabled = True
+
+    def disable(self) -> None:
+        """关闭追踪（已记录的事件保留）"""
+        self.enabled = False
+
+    def clear(self) -> None:
+        """清空已记录的事件"""
+        with self._lock:
+            self._events.clear()
+            self._thread_names.clear()
+            self._origin = time.perf_counter_ns()
+
+    def span(self, name: str, cat: str = "llm", **args):
+        """记录一段耗时
+
+        Args:
+            name: 阶段名（如 queue_wait、connect、request、decode、retry_backoff）
+            cat: 分类
+            **args: 附加参数，显示在 trace 详情中
+
+        Returns:
+            上下文管理器
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def complete(self, name: str, start_ns: int, end_ns: Optional[int] = None, cat: str = "llm", **args) -> None:
+        """记录一段已知起止时间的耗时（如排队等待）
+
+        Args:
+            name: 阶段名
+            start_ns: 开始时间（time.perf_counter_ns()）
+            end_ns: 结束时间，默认当前时间
+            cat: 分类
+            **args: 附加参数
+        """
+        if not self.enabled:
+            return
+        self._record(name, cat, start_ns, end_ns or time.perf_counter_ns(), args)
+
+    def instant(self, name: str, cat: str = "llm", **args) -> None:
+        """记录一个瞬时事件（如收到首字节）"""
+        if not self.enabled:
+            return
+        self._record(name, cat, time.perf_counter_ns(), None, args)
+
+    def _record(self, name: str, cat: str, start_ns: int, end_ns: Optional[int], args: Dict[str, Any]) -> None:
+        thread = threading.current_thread()
+        tid = thread.ident or 0
+        if tid not in self._thread_names:
+            # 每个线程只写入一次，加锁与 export_chrome_trace 的复制互斥
+            with self._lock:
+                self._thread_names.setdefault(tid, thread.name)
+
+        event: Dict[str, Any] = {
+            "name": name,
+            "cat": cat,
+            "ts": (start_ns - self._origin) / 1000,
+            "pid": os.getpid(),
+            "tid": tid,
+        }
+        if end_ns is None:
+            event["ph"] = "i"
+            event["s"] = "t"
+        else:
+            event["ph"] = "X"
+            event["dur"] = (end_ns - start_ns) / 1000
+        if args:
+            event["args"] = args
+        # deque.append 是原子操作，无需加锁
+        self._events.append(event)
+
+    def export_chrome_trace(self, path: str) -> int:
+        """导出为 Chrome Trace Event 格式 JSON（可在 chrome://tracing 或 ui.perfetto.dev 打开）
+
+        Args:
+            path: 输出文件路径
+
+        Returns:
+            导出的事件数
+        """
+        with self._lock:
+            events = list(self._events)
+            names = dict(self._thread_names)
+
+        pid = os.getpid()
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in names.items()
+        ]
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"traceEvents": metadata + events, "displayTimeUnit": "ms"},
+                f,
+                ensure_ascii=False,
+                default=str,
+            )
+        return len(events)
+
+
+# 全局追踪器
+tracer = Tracer()
@@ -0,0 +1,286 @@
+"""HTTP 传输层"""
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+import requests
+
+from .tracing import tracer
+
+Timeout = Union[float, Tuple[float, float]]
+
+PROXY_VARS = ['http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY', 'all_proxy', 'ALL_PROXY']
+
+
+def encode_body(
+    payload: Dict[str, Any],
+    headers: Dict[str, str],
+    compress: bool = False,
+    compress_min_bytes: int = 1024,
+) -> Tuple[bytes, Dict[str, str]]:
+    """把请求体编码为 UTF-8 JSON，必要时 gzip 压缩
+
+    Args:
+        payload: 请求体
+        headers: 原始请求头
+        compress: 是否启用 gzip 请求体压缩
+        compress_min_bytes: 小于该字节数的请求体不压缩
+
+    Returns:
+        (请求体字节, 新的请求头)
+    """
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = {**headers, "Content-Type": "application/json; charset=utf-8"}
+    if compress and len(body) >= compress_min_bytes:
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+def http_error(
+    url: str,
+    status: int,
+    content: bytes,
+    headers: Optional[Dict[str, str]] = None,
+) -> requests.HTTPError:
+    """构造与 requests 一致的 HTTPError，上层可照常读取 e.response.status_code"""
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = content
+    resp.headers.update(headers or {})
+    resp.url = url
+    return requests.HTTPError(f"{status} Error for url: {url}", response=resp)
+
+
+class RequestsTransport:
+    """基于 requests 的 HTTP/1.1 传输（默认），禁用代理以避免连接问题"""
+
+    def __init__(
+        self,
+        verify: bool = True,
+        compress: bool = False,
+        compress_min_bytes: int = 1024,
+    ):
+        """
+        Args:
+            verify: 是否校验 SSL 证书（False = curl -k）
+            compress: 是否 gzip 压缩请求体（需服务端支持 Content-Encoding: gzip）
+            compress_min_bytes: 小于该字节数的请求体不压缩
+        """
+        self.verify = verify
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+
+    def post(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        timeout: Timeout,
+    ) -> Dict[str, Any]:
+        """发送 POST 请求并返回 JSON
+
+        Args:
+            url: 请求地址
+            headers: 请求头
+            payload: 请求体
+            timeout: 超时（秒）或 (连接超时, 读取超时)
+
+        Returns:
+            响应 JSON
+        """
+        with tracer.span("encode"):
+            body, headers = encode_body(payload, headers, self.compress, self.compress_min_bytes)
+        # 响应压缩由 requests 自动协商（Accept-Encoding: gzip, deflate）并解压
+
+        # 保存原始环境变量
+        original_proxies = {}
+        for var in PROXY_VARS:
+            if var in os.environ:
+                original_proxies[var] = os.environ[var]
+                del os.environ[var]
+
+        try:
+            with tracer.span("http", url=url, request_bytes=len(body)) as span:
+                # request 阶段包含建连、发送请求和等待首字节（stream=True 在收到响应头后返回）
+                with tracer.span("request"):
+                    # 设置 proxies 参数为空字典，确保不使用任何代理
+                    resp = requests.post(
+                        url,
+                        headers=headers,
+                        data=body,
+                        timeout=timeout,
+                        proxies={},  # 空字典表示不使用代理
+                        verify=self.verify,
+                        stream=True,
+                    )
+                tracer.instant("first_byte", status=resp.status_code)
+                with tracer.span("download"):
+                    content = resp.content
+                span.set(status=resp.status_code, response_bytes=len(content))
+                resp.raise_for_status()
+                with tracer.span("decode"):
+                    return resp.json()
+        finally:
+            # 恢复原始环境变量
+            for var, value in original_proxies.items():
+                os.environ[var] = value
+
+    def close(self) -> None:
+        """释放连接（requests 无长连接，无需处理）"""
+
+
+class HTTP2Transport:
+    """基于 httpx 的 HTTP/2 传输
+
+    所有并发请求在少量连接上多路复用。需要安装可选依赖:
+        pip install "httpx[http2]"
+
+    异常统一转换为 requests 的异常类型，上层的重试、并发控制无需区分传输方式。
+    """
+
+    def __init__(
+        self,
+        verify: bool = True,
+        compress: bool = False,
+        compress_min_bytes: int = 1024,
+        max_connections: int = 64,
+        http1: bool = True,
+    ):
+        """
+        Args:
+            verify: 是否校验 SSL 证书
+            compress: 是否 gzip 压缩请求体
+            compress_min_bytes: 小于该字节数的请求体不压缩
+            max_connections: 最大连接数；HTTP/2 下并发流会优先复用已有连接，
+                实际连接数远小于该值，服务端不支持 HTTP/2 时退化为 HTTP/1.1 长连接池
+            http1: 是否允许退回 HTTP/1.1；False 时对 http:// 地址也直接使用 HTTP/2
+                （h2c prior knowledge，适用于内网或本地不走 TLS 的服务）
+        """
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError('HTTP/2 传输需要 httpx，请运行: pip install "httpx[http2]"') from e
+
+        self._httpx = httpx
+        self.verify = verify
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self.max_connections = max_connections
+        self.http1 = http1
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        """延迟创建共享的 httpx.Client（线程安全）"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._httpx.Client(
+                        http1=self.http1,
+                        http2=True,
+                        verify=self.verify,
+                        trust_env=False,  # 不使用代理
+                        limits=self._httpx.Limits(
+                            max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections,
+                        ),
+                        headers={"Accept-Encoding": "gzip, deflate"},
+                    )
+        return self._client
+
+    def post(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        payload: Dict[str, Any],
+        timeout: Timeout,
+    ) -> Dict[str, Any]:
+        """发送 POST 请求并返回 JSON，参数同 RequestsTransport.post"""
+        httpx = self._httpx
+        with tracer.span("encode"):
+            body, headers = encode_body(payload, headers, self.compress, self.compress_min_bytes)
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        # 开启追踪时借助 httpcore 的 trace 回调拆分建连、发送、等待首字节、下载各阶段
+        extensions = {"trace": _HttpcoreTrace()} if tracer.enabled else None
+
+        try:
+            with tracer.span("http", url=url, request_bytes=len(body)) as span:
+                resp = self.client.post(
+                    url,
+                    content=body,
+                    headers=headers,
+                    timeout=httpx.Timeout(read, connect=connect),
+                    extensions=extensions,
+                )
+                span.set(status=resp.status_code, http_version=resp.http_version)
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+
+        if resp.status_code >= 400:
+            raise http_error(url, resp.status_code, resp.content, resp.headers)
+        with tracer.span("decode"):
+            return resp.json()
+
+    def close(self) -> None:
+        """关闭连接池"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class _HttpcoreTrace:
+    """把 httpcore 的 "xxx.started" / "xxx.complete" 回调转换为 span"""
+
+    def __init__(self):
+        self._started: Dict[str, int] = {}
+
+    def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        # 如 connection.connect_tcp.started、http2.receive_response_headers.complete
+        prefix, _, phase = event_name.rpartition(".")
+        name = prefix.rpartition(".")[2]
+        if phase == "started":
+            self._started[name] = time.perf_counter_ns()
+        elif phase in ("complete", "failed") and name in self._started:
+            tracer.complete(name, self._started.pop(name), cat="http")
+            if name == "receive_response_headers" and phase == "complete":
+                tracer.instant("first_byte", cat="http")
+
+
+def create_transport(
+    http2: bool = False,
+    verify: bool = True,
+    compress: bool = False,
+    cassette: Optional[str] = None,
+    cassette_mode: str = "auto",
+    latency_scale: float = 0.0,
+    **kwargs,
+):
+    """按配置创建传输层
+
+    Args:
+        http2: 是否使用 HTTP/2（需要 httpx[http2]）
+        verify: 是否校验 SSL 证书
+        compress: 是否 gzip 压缩请求体
+        cassette: 磁带文件路径，设置后包装为录制/回放传输
+        cassette_mode: record / replay / auto
+        latency_scale: 回放耗时相对录制耗时的倍数，0 表示内存速度
+        **kwargs: 其他传输参数
+
+    Returns:
+        传输实例
+    """
+    if http2:
+        transport = HTTP2Transport(verify=verify, compress=compress, **kwargs)
+    else:
+        transport = RequestsTransport(verify=verify, compress=compress, **kwargs)
+    if cassette:
+        from .cassette import RecordReplayTransport
+        return RecordReplayTransport(cassette, inner=transport, mode=cassette_mode, latency_scale=latency_scale)
+    return transport
@@ -1,13 +1,17 @@
 """火山引擎 VolcEngine Ark LLM"""
 import os
-import requests
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Union
 from .base import BaseLLM
+from .deadline import Deadline
+from .transport import RequestsTransport
 
 
 class VolcEngineLLM(BaseLLM):
     """火山引擎 VolcEngine Ark 大模型服务封装"""
 
+    # Ark embeddings 单次请求最多 256 条文本
+    max_embed_batch = 256
+
     def __init__(
         self,
         model: Optional[str] = None,
@@ -16,6 +20,9 @@ class VolcEngineLLM(BaseLLM):
         temperature: float = 0.01,
         max_tokens: int = 2048,
         timeout: int = 60,
+        connect_timeout: float = 10,
+        embedding_model: Optional[str] = None,
+        transport=None,
     ):
         # 优先用传入参数，其次用环境变量
         self.api_key = api_key or os.getenv("HUOSHAN_API_KEY")
@@ -25,6 +32,10 @@ class VolcEngineLLM(BaseLLM):
         )
         model = model or os.getenv("HUOSHAN_MODEL_NAME")
         self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.embedding_model = embedding_model or os.getenv("HUOSHAN_EMBEDDING_MODEL")
+        # HTTP 传输层（可替换为 HTTP2Transport 等），默认 requests
+        self.transport = transport or RequestsTransport()
 
         if not self.api_key:
             raise ValueError("HUOSHAN_API_KEY is not set in env or passed in.")
@@ -33,6 +44,11 @@ class VolcEngineLLM(BaseLLM):
 
         # 标准 chat/completions 接口
         self.chat_url = f"{self.base_url.rstrip('/')}/chat/completions"
+        # 向量接口
+        self.embeddings_url = f"{self.base_url.rstrip('/')}/embeddings"
+        # 上下文缓存接口（Context API）
+        self.context_create_url = f"{self.base_url.rstrip('/')}/context/create"
+        self.context_chat_url = f"{self.base_url.rstrip('/')}/context/chat/completions"
 
         super().__init__(model=model, temperature=temperature, max_tokens=max_tokens)
 
@@ -41,6 +57,8 @@ class VolcEngineLLM(BaseLLM):
         messages: List[Dict[str, str]],
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
+        context_id: Optional[str] = None,
+        deadline: Optional[Union[float, Deadline]] = None,
         **kwargs
     ) -> str:
         """
@@ -50,6 +68,8 @@ class VolcEngineLLM(BaseLLM):
             messages: 消息列表，格式与 OpenAI 一致
             temperature: 温度参数
             max_tokens: 最大token数
+            context_id: 上下文缓存ID，传入时走 context/chat/completions 接口
+            deadline: 截止时间（Deadline 或剩余秒数），已过期则不发送
             **kwargs: 其他参数（如 top_p、stop 等）
 
         Returns:
@@ -61,6 +81,11 @@ class VolcEngineLLM(BaseLLM):
             "temperature": temperature if temperature is not None else self.temperature,
         }
 
+        url = self.chat_url
+        if context_id is not None:
+            payload["context_id"] = context_id
+            url = self.context_chat_url
+
         if max_tokens is not None:
             payload["max_tokens"] = max_tokens
         elif self.max_tokens is not None:
@@ -74,38 +99,76 @@ class VolcEngineLLM(BaseLLM):
             "Authorization": f"Bearer {self.api_key}",
         }
 
-        data = self._make_request(payload, headers)
-        try:
-            return data["choices"][0]["message"]["content"]
-        except (KeyError, IndexError, TypeError) as e:
-            raise RuntimeError(f"Unexpected response format: {data}") from e
+        data = self._make_request(payload, headers, url=url, deadline=deadline)
+        return self._parse_response(data)
+
+    def create_context(
+        self,
+        messages: List[Dict[str, str]],
+        ttl: int = 3600,
+        mode: str = "common_prefix",
+    ) -> Dict[str, Any]:
+        """
+        创建服务端上下文缓存（前缀缓存）
+
+        Args:
+            messages: 需要缓存的前缀消息（通常是固定的 system prompt）
+            ttl: 缓存有效期（秒），每次使用后重新计时
+            mode: 缓存模式，默认 common_prefix
+
+        Returns:
+            接口返回数据，其中 id 为后续 chat 使用的 context_id
+        """
+        payload: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "mode": mode,
+            "ttl": ttl,
+        }
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+        data = self._make_request(payload, headers, url=self.context_create_url)
+        if not isinstance(data, dict) or "id" not in data:
+            raise RuntimeError(f"Unexpected response format: {data}")
+        return data
+
+    def _embed_batch(
+        self,
+        texts: List[str],
+        model: str,
+        deadline: Optional[Deadline] = None,
+    ) -> List[List[float]]:
+        """调用 embeddings 接口计算一批向量"""
+        payload: Dict[str, Any] = {
+            "model": model,
+            "input": texts,
+            "encoding_format": "float",
+        }
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}",
+        }
+
+        data = self._make_request(payload, headers, url=self.embeddings_url, deadline=deadline)
+        return self._parse_embeddings(data, len(texts))
 
     def _make_request(
         self,
         payload: Dict[str, Any],
         headers: Dict[str, str],
+        url: Optional[str] = None,
+        deadline: Optional[Union[float, Deadline]] = None,
     ) -> Dict[str, Any]:
-        """通用请求方法，禁用代理以避免连接问题"""
-        # 保存原始环境变量
-        original_proxies = {}
-        proxy_vars = ['http_proxy', 'https_proxy', 'HTTP_PROXY', 'HTTPS_PROXY', 'all_proxy', 'ALL_PROXY']
-        for var in proxy_vars:
-            if var in os.environ:
-                original_proxies[var] = os.environ[var]
-                del os.environ[var]
-
-        try:
-            # 设置 proxies 参数为空字典，确保不使用任何代理
-            resp = requests.post(
-                self.chat_url,
-                headers=headers,
-                json=payload,
-                timeout=self.timeout,
-                proxies={},  # 空字典表示不使用代理
-            )
-            resp.raise_for_status()
-            return resp.json()
-        finally:
-            # 恢复原始环境变量
-            for var, value in original_proxies.items():
-                os.environ[var] = value
+        """通用请求方法，经由传输层发送（默认禁用代理的 requests）"""
+        # 连接/读取超时从截止时间中扣除，已过期时直接抛出 DeadlineExceeded
+        return self.transport.post(
+            url or self.chat_url,
+            headers=headers,
+            payload=payload,
+            timeout=self._request_timeout(deadline),
+        )
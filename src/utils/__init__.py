@@ -2,5 +2,19 @@
 from .config import create_llm, get_config_value
 from .logger import setup_logger
 from .retry import retry_on_failure
+from .micro_batch import MicroBatcher
+from .concurrency import AIMDLimiter, ConcurrencyController
+from .scheduler import Lane, PriorityScheduler
+from .pipeline import Pipeline, Stage, llm_stage
+from .coordinator import LeaseCoordinator
+from .output_budget import AdaptiveMaxTokens
+from .ordering import restore_order, schedule
+from .degradation import DegradationPolicy, LoadShed, create_degradation_policy
+from .requeue import DelayQueue, RequeueExecutor
 
-__all__ = ["create_llm", "get_config_value", "setup_logger", "retry_on_failure"]
+__all__ = ["create_llm", "get_config_value", "setup_logger", "retry_on_failure", "MicroBatcher",
+           "AIMDLimiter", "ConcurrencyController", "Lane", "PriorityScheduler",
+           "Pipeline", "Stage", "llm_stage", "LeaseCoordinator",
+           "AdaptiveMaxTokens", "schedule", "restore_order",
+           "DegradationPolicy", "LoadShed",
+           "create_degradation_policy", "DelayQueue", "RequeueExecutor"]
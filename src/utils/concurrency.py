@@ -0,0 +1,243 @@
+"""自适应（AIMD）并发控制"""
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from loguru import logger
+
+import config
+from src.llms import DeadlineExceeded
+from src.llms.tracing import tracer
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """判断异常是否意味着服务端过载（429/503、超时）
+
+    DeadlineExceeded 是客户端自己的截止时间到期（通常还没发送），不是过载信号，
+    否则排队超时会压低并发上限，进一步加剧排队，形成正反馈。
+    """
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (requests.Timeout, TimeoutError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in (429, 503)
+    return False
+
+
+class AIMDLimiter:
+    """AIMD 并发限制器
+
+    延迟稳定时每完成一"轮"（约 limit 个请求）并发上限加 increase；
+    遇到 429、超时或延迟突增时并发上限乘以 decrease。
+    同一轮内的多次过载信号只触发一次下调，避免一波 429 把并发压到最低。
+    """
+
+    def __init__(
+        self,
+        name: str = "default",
+        initial_limit: Optional[float] = None,
+        min_limit: Optional[float] = None,
+        max_limit: Optional[float] = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_spike_ratio: float = 2.0,
+        ewma_alpha: float = 0.1,
+        warmup_samples: int = 5,
+    ):
+        """
+        Args:
+            name: 限制器名称（通常是 provider 名）
+            initial_limit: 初始并发上限，默认 config.MAX_WORKERS
+            min_limit: 并发下限
+            max_limit: 并发上限
+            increase: 每轮加性增量
+            decrease: 过载时的乘性系数
+            latency_spike_ratio: 延迟超过基线该倍数视为突增
+            ewma_alpha: 基线延迟的指数平滑系数
+            warmup_samples: 用前若干个成功请求延迟的中位数作为初始基线
+        """
+        self.name = name
+        self.min_limit = min_limit or getattr(config, "MIN_CONCURRENCY", 1)
+        self.max_limit = max_limit or getattr(config, "MAX_CONCURRENCY", 64)
+        self.limit = float(initial_limit or config.MAX_WORKERS)
+        self.limit = min(max(self.limit, self.min_limit), self.max_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_spike_ratio = latency_spike_ratio
+        self.ewma_alpha = ewma_alpha
+        self.warmup_samples = max(1, warmup_samples)
+
+        self.in_flight = 0
+        self.waiting = 0  # 等待名额的请求数（排队中，尚未发送）
+        self.baseline_latency: Optional[float] = None
+        self._warmup: List[float] = []
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """阻塞直到获得一个并发名额
+
+        Args:
+            timeout: 最长等待秒数，None 表示一直等待
+
+        Returns:
+            是否获得名额
+        """
+        with self._cond:
+            if self._try_acquire():
+                return True
+            self.waiting += 1
+            try:
+                return self._cond.wait_for(self._try_acquire, timeout=timeout)
+            finally:
+                self.waiting -= 1
+
+    async def acquire_async(self) -> None:
+        """异步等待一个并发名额（不占用事件循环线程）"""
+        loop = asyncio.get_running_loop()
+        counted = False
+        try:
+            while True:
+                with self._cond:
+                    if self._try_acquire():
+                        return
+                    if not counted:
+                        self.waiting += 1
+                        counted = True
+                    future = loop.create_future()
+                    self._async_waiters.append((loop, future))
+                await future
+        finally:
+            if counted:
+                with self._cond:
+                    self.waiting -= 1
+
+    def _wake_waiters(self) -> None:
+        """唤醒所有等待者重新竞争名额（需持有锁）"""
+        self._cond.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+    def release(self, latency: Optional[float] = None, error: Optional[BaseException] = None) -> None:
+        """归还名额并根据本次结果调整并发上限
+
+        Args:
+            latency: 本次请求耗时（秒）
+            error: 本次请求的异常，成功时为 None
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if error is not None:
+                if is_overload_error(error):
+                    self._on_overload(f"{type(error).__name__}")
+            elif latency is not None:
+                self._on_success(latency)
+            self._wake_waiters()
+
+    def _on_success(self, latency: float) -> None:
+        if self.baseline_latency is None:
+            # 单个样本可能偏离很大，用前几个样本的中位数作为初始基线
+            self._warmup.append(latency)
+            if len(self._warmup) >= self.warmup_samples:
+                self.baseline_latency = sorted(self._warmup)[len(self._warmup) // 2]
+                self._warmup = []
+            return
+
+        spike = latency > self.baseline_latency * self.latency_spike_ratio
+        # 突增样本也计入基线，延迟整体上移后基线随之跟上，不会一直判为突增
+        self.baseline_latency += self.ewma_alpha * (latency - self.baseline_latency)
+        if spike:
+            self._on_overload(f"延迟突增 {latency:.2f}s")
+            return
+
+        # 每个成功请求增加 increase / limit，约每轮增加 increase
+        self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def _on_overload(self, reason: str) -> None:
+        now = time.monotonic()
+        # 一轮（约一个基线延迟）内只下调一次
+        window = self.baseline_latency or 1.0
+        if now - self._last_decrease < window:
+            return
+        self._last_decrease = now
+
+        old = self.limit
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        logger.warning(f"[{self.name}] 检测到过载（{reason}），并发上限 {old:.1f} -> {self.limit:.1f}")
+
+    @contextmanager
+    def slot(self):
+        """占用一个名额执行一次请求，自动记录耗时与异常"""
+        with tracer.span("rate_limit_wait", provider=self.name):
+            self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(time.monotonic() - start, error=e)
+            raise
+        self.release(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """slot() 的异步版本"""
+        with tracer.span("rate_limit_wait", provider=self.name):
+            await self.acquire_async()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(time.monotonic() - start, error=e)
+            raise
+        self.release(time.monotonic() - start)
+
+
+class ConcurrencyController:
+    """按 provider 分别维护 AIMD 并发限制器"""
+
+    def __init__(self, **limiter_kwargs):
+        """
+        Args:
+            **limiter_kwargs: 传给每个 AIMDLimiter 的默认参数
+        """
+        self.limiter_kwargs = limiter_kwargs
+        self._limiters: Dict[str, AIMDLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, provider: str) -> AIMDLimiter:
+        """获取（必要时创建）provider 对应的限制器"""
+        with self._lock:
+            if provider not in self._limiters:
+                self._limiters[provider] = AIMDLimiter(name=provider, **self.limiter_kwargs)
+            return self._limiters[provider]
+
+    def slot(self, provider: str):
+        """同步占用 provider 的一个并发名额"""
+        return self.limiter(provider).slot()
+
+    def aslot(self, provider: str):
+        """异步占用 provider 的一个并发名额"""
+        return self.limiter(provider).aslot()
+
+    def waiting(self) -> int:
+        """所有 provider 上等待并发名额的请求数（可计入积压深度）"""
+        with self._lock:
+            limiters = list(self._limiters.values())
+        return sum(limiter.waiting for limiter in limiters)
+
+    def limits(self) -> Dict[str, float]:
+        """当前各 provider 的并发上限"""
+        with self._lock:
+            return {name: limiter.limit for name, limiter in self._limiters.items()}
@@ -15,6 +15,7 @@ from src.llms import (
     AzureLLM,
     CustomLLM,
     AliyunLLM,
+    create_transport,
 )
 
 
@@ -39,6 +40,16 @@ def create_llm(
     model = model or project_config.DEFAULT_MODEL
     temperature = temperature or project_config.DEFAULT_TEMPERATURE
     max_tokens = max_tokens or project_config.DEFAULT_MAX_TOKENS
+    connect_timeout = getattr(project_config, "CONNECT_TIMEOUT", 10.0)
+    embedding_model = getattr(project_config, "EMBEDDING_MODEL", None)
+    transport = create_transport(
+        http2=provider in getattr(project_config, "HTTP2_PROVIDERS", []),
+        verify=(provider != "custom" or project_config.CUSTOM_VERIFY_SSL.lower() == "true"),
+        compress=getattr(project_config, "COMPRESS_REQUEST_BODY", False),
+        cassette=getattr(project_config, "CASSETTE_FILE", None),
+        cassette_mode=getattr(project_config, "CASSETTE_MODE", "auto"),
+        latency_scale=getattr(project_config, "CASSETTE_LATENCY_SCALE", 0.0),
+    )
 
     if provider == "volcengine":
         return VolcEngineLLM(
@@ -46,7 +57,10 @@ def create_llm(
             base_url=project_config.HUOSHAN_BASE_URL,
             model=model or project_config.HUOSHAN_MODEL_NAME,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            connect_timeout=connect_timeout,
+            embedding_model=embedding_model,
+            transport=transport
         )
     elif provider == "azure":
         return AzureLLM(
@@ -55,7 +69,10 @@ def create_llm(
             api_version=project_config.AZURE_API_VERSION,
             model=model or project_config.AZURE_DEPLOYED_MODELS,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            connect_timeout=connect_timeout,
+            embedding_model=embedding_model,
+            transport=transport
         )
     elif provider == "custom":
         return CustomLLM(
@@ -64,7 +81,10 @@ def create_llm(
             model=model or project_config.CUSTOM_MODEL_NAME,
             temperature=temperature,
             max_tokens=max_tokens,
-            verify_ssl=(project_config.CUSTOM_VERIFY_SSL.lower() == "true")
+            connect_timeout=connect_timeout,
+            embedding_model=embedding_model,
+            verify_ssl=(project_config.CUSTOM_VERIFY_SSL.lower() == "true"),
+            transport=transport
         )
     elif provider == "aliyun":
         return AliyunLLM(
@@ -72,7 +92,10 @@ def create_llm(
             base_url=project_config.ALIYUN_BASE_URL,
             model=model or project_config.ALIYUN_MODEL_NAME,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            connect_timeout=connect_timeout,
+            embedding_model=embedding_model,
+            transport=transport
         )
     else:
         raise ValueError(f"不支持的provider: {provider}")
@@ -0,0 +1,509 @@
+"""基于共享文件系统租约的多机任务分发"""
+import json
+import os
+import random
+import socket
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    """先写临时文件再原子替换，其他机器不会读到半截文件"""
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _create_exclusive(path: Path, data: Dict[str, Any]) -> bool:
+    """原子地创建文件，已存在时返回 False"""
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    return True
+
+
+class Chunk:
+    """输入文件中的一段字节区间 [start, end)
+
+    offset 为本次处理的起点：回收他人过期租约时从原持有者最后汇报的进度继续，
+    count 为已沿用的原持有者的结果条数。
+    """
+
+    def __init__(self, chunk_id: str, start: int, end: int, token: str = ""):
+        self.id = chunk_id
+        self.start = start
+        self.end = end
+        self.token = token
+        self.offset = start
+        self.count = 0
+
+    def __repr__(self) -> str:
+        return f"Chunk({self.id}, {self.start}-{self.end})"
+
+
+class _InvalidLine:
+    """输入中无法解析的行，输出为 failed 记录"""
+
+    def __init__(self, raw: bytes, error: Exception):
+        self.raw = raw
+        self.error = error
+
+    def output(self) -> Dict[str, Any]:
+        return {
+            "status": "failed",
+            "error": f"不是合法的 JSON: {self.error}",
+            "raw": self.raw.decode("utf-8", errors="replace").rstrip("\r\n"),
+        }
+
+
+class LeaseCoordinator:
+    """通过共享目录中的租约文件协调多台机器处理同一个输入
+
+    目录结构（work_dir 位于所有机器可见的共享文件系统上）:
+        chunks/<id>.json   分片定义（字节区间）
+        leases/<id>.json   租约：持有者、过期时间、处理进度
+        steal/<id>         窃取请求：空闲的机器请求持有者把剩余区间拆出一半
+        outputs/<id>.jsonl 分片结果（处理中为 .<id>.jsonl.<token>.tmp）
+        done/<id>.json     分片完成标记
+
+    - 机器随机顺序认领未完成的分片，认领通过 O_EXCL 创建租约文件保证互斥
+    - 持有者每处理完一批先把结果落盘再续约并汇报进度，租约过期（机器宕机）后
+      其他机器通过 rename 原子地回收，沿用原持有者已落盘的结果并从汇报的进度继续
+    - 没有可认领的分片时，空闲机器向剩余最多的分片发出窃取请求，
+      持有者在下次续约时把剩余区间拆出后半段作为新分片
+    - 全部完成后由一台机器按输入顺序合并结果
+
+    用法（每台机器运行同样的代码）:
+        coordinator = LeaseCoordinator("/shared/job1", "/shared/input.jsonl")
+        coordinator.run(process_item, workers=8)
+        coordinator.merge("/shared/output.jsonl")
+    """
+
+    def __init__(
+        self,
+        work_dir: str,
+        input_path: str,
+        chunk_size: int = 1000,
+        lease_ttl: float = 120.0,
+        batch_size: int = 32,
+        worker_id: Optional[str] = None,
+    ):
+        """
+        Args:
+            work_dir: 共享工作目录
+            input_path: 输入 JSONL 文件（所有机器可见）
+            chunk_size: 初始每个分片的行数
+            lease_ttl: 租约有效期（秒），需大于处理一个 batch 的耗时
+            batch_size: 每处理多少条续约一次
+            worker_id: 本机标识，默认 hostname-pid
+        """
+        self.work_dir = Path(work_dir)
+        self.input_path = Path(input_path)
+        self.chunk_size = chunk_size
+        self.lease_ttl = lease_ttl
+        self.batch_size = batch_size
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+
+        for sub in ("chunks", "leases", "steal", "outputs", "done"):
+            (self.work_dir / sub).mkdir(parents=True, exist_ok=True)
+
+    def _path(self, kind: str, chunk_id: str, suffix: str = ".json") -> Path:
+        return self.work_dir / kind / f"{chunk_id}{suffix}"
+
+    # ------------------------------------------------------------------
+    # 分片
+    # ------------------------------------------------------------------
+
+    def prepare(self, wait_timeout: float = 600.0) -> None:
+        """切分输入（只有一台机器执行，其余等待完成）"""
+        ready = self.work_dir / "READY"
+        if ready.exists():
+            return
+
+        if not _create_exclusive(self.work_dir / "prepare.lock", {"worker": self.worker_id}):
+            deadline = time.time() + wait_timeout
+            while not ready.exists():
+                if time.time() > deadline:
+                    raise TimeoutError(f"等待分片超时: {self.work_dir}")
+                time.sleep(0.5)
+            return
+
+        count = 0
+        with open(self.input_path, "rb") as f:
+            while True:
+                start = f.tell()
+                lines = 0
+                while lines < self.chunk_size and f.readline():
+                    lines += 1
+                if lines == 0:
+                    break
+                _write_json(self._path("chunks", f"{count:06d}"),
+                            {"id": f"{count:06d}", "start": start, "end": f.tell()})
+                count += 1
+
+        _write_json(ready, {"chunks": count, "worker": self.worker_id})
+        logger.info(f"输入已切分为 {count} 个分片: {self.work_dir}")
+
+    def _chunk_ids(self) -> List[str]:
+        return sorted(p.stem for p in (self.work_dir / "chunks").glob("*.json"))
+
+    def _pending_ids(self) -> List[str]:
+        return [cid for cid in self._chunk_ids() if not self._path("done", cid).exists()]
+
+    # ------------------------------------------------------------------
+    # 租约
+    # ------------------------------------------------------------------
+
+    def claim(self) -> Optional[Chunk]:
+        """认领一个未完成的分片（包括回收过期租约），没有可认领的分片时返回 None"""
+        pending = self._pending_ids()
+        random.shuffle(pending)  # 随机顺序，减少多台机器争抢同一个分片
+
+        for chunk_id in pending:
+            lease_path = self._path("leases", chunk_id)
+            lease = _read_json(lease_path)
+            if lease is not None:
+                if lease["expires_at"] > time.time():
+                    continue
+                # 租约过期：rename 是原子的，多台机器同时回收时只有一台成功
+                expired_path = lease_path.with_name(f".{chunk_id}.{uuid.uuid4().hex}.expired")
+                try:
+                    os.rename(lease_path, expired_path)
+                except FileNotFoundError:
+                    continue
+                # 以 rename 之后的内容为准（读取之后原持有者可能又汇报过进度），读完即删除
+                lease = _read_json(expired_path) or lease
+                expired_path.unlink(missing_ok=True)
+                logger.warning(f"回收过期租约: {chunk_id}（原持有者 {lease['worker']}）")
+
+            token = uuid.uuid4().hex
+            if not _create_exclusive(lease_path, self._lease(token, None)):
+                continue
+
+            data = _read_json(self._path("chunks", chunk_id))
+            if data is None or self._path("done", chunk_id).exists():
+                # 认领期间已被其他机器完成
+                self._release(chunk_id, token)
+                continue
+
+            chunk = Chunk(chunk_id, data["start"], data["end"], token)
+            if lease is not None:
+                self._adopt_output(chunk, lease)
+                # 立即把沿用的进度写入新租约，本机在第一次续约前宕机也不会丢失
+                if not self.renew(chunk, chunk.offset):
+                    self._tmp_output(chunk_id, token).unlink(missing_ok=True)
+                    continue
+            return chunk
+        return None
+
+    def _tmp_output(self, chunk_id: str, token: str) -> Path:
+        output_path = self._path("outputs", chunk_id, ".jsonl")
+        return output_path.with_name(f".{output_path.name}.{token}.tmp")
+
+    def _adopt_output(self, chunk: Chunk, old_lease: Dict[str, Any]) -> None:
+        """沿用过期租约持有者已落盘的结果，把 chunk.offset 移到其汇报的进度"""
+        old_tmp = self._tmp_output(chunk.id, old_lease.get("token", ""))
+        offset = old_lease.get("offset")
+        if offset is None or not chunk.start < offset <= chunk.end:
+            old_tmp.unlink(missing_ok=True)
+            return
+
+        new_tmp = self._tmp_output(chunk.id, chunk.token)
+        kept = 0
+        try:
+            with open(old_tmp, "r", encoding="utf-8") as src, open(new_tmp, "w", encoding="utf-8") as dst:
+                for line in src:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # 宕机时写了一半的行
+                    # 只保留已汇报进度之前的结果，之后的行会重新处理
+                    if record["offset"] >= offset:
+                        break
+                    dst.write(line)
+                    kept += 1
+        except FileNotFoundError:
+            # 原持有者已删除临时结果，从头处理
+            new_tmp.unlink(missing_ok=True)
+            return
+        old_tmp.unlink(missing_ok=True)
+
+        chunk.offset = offset
+        chunk.count = kept
+        logger.info(f"分片 {chunk.id} 沿用原持有者的 {kept} 条结果，从偏移 {offset} 继续")
+
+    def _lease(self, token: str, offset: Optional[int]) -> Dict[str, Any]:
+        return {
+            "worker": self.worker_id,
+            "token": token,
+            "expires_at": time.time() + self.lease_ttl,
+            "offset": offset,
+        }
+
+    def renew(self, chunk: Chunk, offset: int) -> bool:
+        """续约并汇报进度；有窃取请求时拆分剩余区间
+
+        Args:
+            chunk: 持有的分片（end 可能因拆分而缩小）
+            offset: 已处理到的字节位置（此前的结果必须已经落盘）
+
+        Returns:
+            是否仍持有租约；False 表示租约已被回收，应放弃该分片
+        """
+        lease_path = self._path("leases", chunk.id)
+        lease = _read_json(lease_path)
+        if lease is None or lease.get("token") != chunk.token:
+            return False
+
+        if lease["expires_at"] - time.time() > self.lease_ttl * 0.1:
+            # 租约未过期，其他机器不会回收，可直接原子替换
+            _write_json(lease_path, self._lease(chunk.token, offset))
+        else:
+            # 已过期或临近过期，其他机器可能正在回收：与回收走同样的 rename + O_EXCL 流程
+            held_path = lease_path.with_name(f".{chunk.id}.{uuid.uuid4().hex}.expired")
+            try:
+                os.rename(lease_path, held_path)
+            except FileNotFoundError:
+                return False
+            try:
+                held = _read_json(held_path)
+                if held is None or held.get("token") != chunk.token:
+                    # 读取之后已被其他机器回收：把对方的租约放回去（已有新租约时 link 失败）
+                    try:
+                        os.link(held_path, lease_path)
+                    except FileExistsError:
+                        pass
+                    return False
+                if not _create_exclusive(lease_path, self._lease(chunk.token, offset)):
+                    return False
+            finally:
+                # 新租约已创建或对方的租约已放回，旧文件不再需要
+                held_path.unlink(missing_ok=True)
+
+        # 写入后再次确认持有者
+        lease = _read_json(lease_path)
+        if lease is None or lease.get("token") != chunk.token:
+            return False
+
+        steal_path = self._path("steal", chunk.id, "")
+        if steal_path.exists():
+            self._split(chunk, offset)
+            steal_path.unlink(missing_ok=True)
+        return True
+
+    def _release(self, chunk_id: str, token: str) -> None:
+        """释放租约：只删除仍属于 token 的租约，不误删其他机器回收后的新租约"""
+        lease_path = self._path("leases", chunk_id)
+        lease = _read_json(lease_path)
+        if lease is not None and lease.get("token") == token:
+            lease_path.unlink(missing_ok=True)
+
+    def _split(self, chunk: Chunk, offset: int) -> None:
+        """把 [offset, end) 的后半段拆成新分片"""
+        if chunk.end - offset < 2 * 1024:
+            return
+        with open(self.input_path, "rb") as f:
+            f.seek(offset + (chunk.end - offset) // 2)
+            f.readline()  # 对齐到行首
+            mid = f.tell()
+        if mid >= chunk.end:
+            return
+
+        new_id = f"{chunk.id}-{uuid.uuid4().hex[:6]}"
+        # 先创建新分片再缩小原分片：中途宕机最多重复处理，不会漏掉数据（合并时按偏移去重）
+        _write_json(self._path("chunks", new_id), {"id": new_id, "start": mid, "end": chunk.end})
+        _write_json(self._path("chunks", chunk.id), {"id": chunk.id, "start": chunk.start, "end": mid})
+        logger.info(f"分片 {chunk.id} 被窃取，拆出 {new_id}: {mid}-{chunk.end}")
+        chunk.end = mid
+
+    def request_steal(self) -> bool:
+        """向剩余工作最多的在途分片发出窃取请求
+
+        Returns:
+            是否发出了请求
+        """
+        best: Optional[Tuple[int, str]] = None
+        for chunk_id in self._pending_ids():
+            lease = _read_json(self._path("leases", chunk_id))
+            chunk = _read_json(self._path("chunks", chunk_id))
+            if lease is None or chunk is None:
+                continue
+            remaining = chunk["end"] - (lease.get("offset") or chunk["start"])
+            if best is None or remaining > best[0]:
+                best = (remaining, chunk_id)
+
+        if best is None or best[0] < 4 * 1024:
+            return False
+        self._path("steal", best[1], "").touch()
+        return True
+
+    # ------------------------------------------------------------------
+    # 处理
+    # ------------------------------------------------------------------
+
+    def _iter_lines(self, chunk: Chunk) -> Iterator[Tuple[int, int, Dict[str, Any]]]:
+        """从 chunk.offset 起逐行读取分片，产出 (行首偏移, 行尾偏移, 数据)
+
+        每次读取前检查 end，拆分后立即生效。无法解析的行产出 failed 记录（不调用 process_fn）。
+        """
+        with open(self.input_path, "rb") as f:
+            f.seek(chunk.offset)
+            while f.tell() < chunk.end:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    yield offset, f.tell(), json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.warning(f"分片 {chunk.id} 偏移 {offset} 不是合法的 JSON，记为失败: {e}")
+                    yield offset, f.tell(), _InvalidLine(line, e)
+
+    def process_chunk(
+        self,
+        chunk: Chunk,
+        process_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+        executor: ThreadPoolExecutor,
+    ) -> bool:
+        """处理一个分片，返回是否成功完成（租约丢失时返回 False）"""
+        output_path = self._path("outputs", chunk.id, ".jsonl")
+        tmp_path = self._tmp_output(chunk.id, chunk.token)
+        count = chunk.count
+
+        # 回收的分片在沿用的结果后追加
+        with open(tmp_path, "a", encoding="utf-8") as out:
+            lines = self._iter_lines(chunk)
+            while True:
+                batch = []
+                for line in lines:
+                    batch.append(line)
+                    if len(batch) >= self.batch_size:
+                        break
+                if not batch:
+                    break
+
+                valid = [item for _, _, item in batch if not isinstance(item, _InvalidLine)]
+                results = iter(executor.map(process_fn, valid))
+                for offset, _, item in batch:
+                    result = item.output() if isinstance(item, _InvalidLine) else next(results)
+                    # 记录输入偏移，合并时据此排序去重
+                    out.write(json.dumps({"offset": offset, "item": result}, ensure_ascii=False) + "\n")
+                count += len(batch)
+
+                # 先落盘再汇报进度，回收者才能沿用 offset 之前的结果
+                out.flush()
+                os.fsync(out.fileno())
+                if not self.renew(chunk, batch[-1][1]):
+                    logger.warning(f"分片 {chunk.id} 的租约已丢失，放弃")
+                    # 临时结果留给回收者沿用；分片已由其他机器完成时才删除
+                    if self._path("done", chunk.id).exists():
+                        tmp_path.unlink(missing_ok=True)
+                    return False
+
+        try:
+            os.replace(tmp_path, output_path)
+        except FileNotFoundError:
+            # 临时结果已被回收者沿用并删除
+            logger.warning(f"分片 {chunk.id} 已被其他机器接管，放弃")
+            return False
+        _write_json(self._path("done", chunk.id),
+                    {"worker": self.worker_id, "count": count, "start": chunk.start, "end": chunk.end})
+        self._release(chunk.id, chunk.token)
+        return True
+
+    def run(
+        self,
+        process_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+        workers: int = 4,
+        poll_interval: float = 2.0,
+    ) -> int:
+        """认领并处理分片，直到所有分片完成
+
+        Args:
+            process_fn: 处理单条数据的函数
+            workers: 本机并发线程数
+            poll_interval: 没有可认领分片时的轮询间隔（秒）
+
+        Returns:
+            本机完成的分片数
+        """
+        self.prepare()
+        finished = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                chunk = self.claim()
+                if chunk is not None:
+                    if self.process_chunk(chunk, process_fn, executor):
+                        finished += 1
+                    continue
+
+                if not self._pending_ids():
+                    break
+                # 剩余分片都被其他机器持有：请求拆分，稍后再认领
+                self.request_steal()
+                time.sleep(poll_interval)
+
+        logger.info(f"[{self.worker_id}] 完成 {finished} 个分片")
+        return finished
+
+    def merge(self, output_path: str) -> bool:
+        """全部分片完成后按输入顺序合并结果（只有一台机器执行）
+
+        Args:
+            output_path: 合并后的输出文件
+
+        Returns:
+            本机是否执行了合并
+        """
+        if self._pending_ids():
+            raise RuntimeError("仍有未完成的分片，无法合并")
+        if not _create_exclusive(self.work_dir / "merge.lock", {"worker": self.worker_id}):
+            return False
+
+        done = [_read_json(self._path("done", cid)) for cid in self._chunk_ids()]
+        order = sorted(zip(self._chunk_ids(), done), key=lambda x: x[1]["start"])
+
+        output_path = Path(output_path)
+        tmp = output_path.with_name(f".{output_path.name}.tmp")
+        written = 0
+        skipped = 0
+        last_offset = -1
+        with open(tmp, "w", encoding="utf-8") as out:
+            for chunk_id, _ in order:
+                with open(self._path("outputs", chunk_id, ".jsonl"), "r", encoding="utf-8") as f:
+                    for line_no, line in enumerate(f, 1):
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError as e:
+                            logger.error(f"跳过分片 {chunk_id} 结果第 {line_no} 行（不是合法的 JSON）: {e}")
+                            skipped += 1
+                            continue
+                        if record["offset"] <= last_offset:
+                            continue  # 拆分过程中宕机导致的重复区间
+                        last_offset = record["offset"]
+                        out.write(json.dumps(record["item"], ensure_ascii=False) + "\n")
+                        written += 1
+        os.replace(tmp, output_path)
+        logger.info(f"已合并 {len(order)} 个分片、{written} 条结果到 {output_path}")
+        if skipped:
+            logger.warning(f"合并时跳过 {skipped} 行无法解析的结果")
+        return True
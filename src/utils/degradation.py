@@ -0,0 +1,241 @@
+"""积压驱动的降级与削峰"""
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+import config
+from src.llms import DeadlineExceeded
+
+from .config import create_llm
+
+NORMAL = "normal"
+DEGRADED = "degraded"
+SHEDDING = "shedding"
+
+
+class LoadShed(RuntimeError):
+    """系统过载，该请求被主动放弃（不应重试）"""
+
+
+class DegradationPolicy:
+    """根据积压深度和主模型的滚动延迟在主模型、降级模型之间切换
+
+    - normal: 所有请求走主模型
+    - degraded: 积压超过 queue_depth 或主模型 p90 延迟超过 latency_threshold 时，
+      可降级的请求改用 fallback（如 qwen-plus -> qwen-turbo），不可降级的仍走主模型
+    - shedding: 积压超过 shed_queue_depth 时，可降级的请求直接抛出 LoadShed
+
+    主模型的延迟包括失败的请求（超时按实际等待的时间计入）。
+    积压和延迟都回落到阈值的 recover_ratio 以下、且在当前状态停留满 min_hold 秒后
+    自动逐级恢复，避免在阈值附近来回切换。last_served() 返回本线程上一次请求
+    由哪个模型处理（或 "shed"），便于在结果中记录。
+
+    用法:
+        policy = DegradationPolicy(
+            create_llm(model="qwen-plus"), create_llm(model="qwen-turbo"),
+            backlog_fn=lambda: pending,
+        )
+        result = policy.chat(messages, degradable=item["priority"] == "low")
+        served_by = policy.last_served()
+    """
+
+    def __init__(
+        self,
+        primary: Any,
+        fallback: Optional[Any] = None,
+        queue_depth: Optional[int] = None,
+        latency_threshold: Optional[float] = None,
+        shed_queue_depth: Optional[int] = None,
+        recover_ratio: float = 0.5,
+        min_hold: float = 30.0,
+        latency_window: float = 60.0,
+        backlog_fn: Optional[Callable[[], int]] = None,
+    ):
+        """
+        Args:
+            primary: 主模型（BaseLLM 或 ContextCacheManager 等包装）
+            fallback: 降级模型，None 时跳过 degraded 阶段，过载直接进入 shedding
+            queue_depth: 进入 degraded 的积压深度，默认 config.DEGRADE_QUEUE_DEPTH
+            latency_threshold: 进入 degraded 的主模型 p90 延迟（秒），默认 config.DEGRADE_LATENCY
+            shed_queue_depth: 进入 shedding 的积压深度，默认 config.SHED_QUEUE_DEPTH（None 表示不丢弃）
+            recover_ratio: 指标回落到阈值的该比例以下才恢复
+            min_hold: 每个状态至少停留的秒数
+            latency_window: 只统计最近该秒数内的主模型延迟
+            backlog_fn: 返回外部排队数（如尚未开始的数据条数、等待并发名额的请求数），
+                与在途请求数相加为积压深度
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.queue_depth = queue_depth or getattr(config, "DEGRADE_QUEUE_DEPTH", 500)
+        self.latency_threshold = latency_threshold or getattr(config, "DEGRADE_LATENCY", 30.0)
+        self.shed_queue_depth = shed_queue_depth or getattr(config, "SHED_QUEUE_DEPTH", None)
+        if fallback is None and self.shed_queue_depth is None:
+            self.shed_queue_depth = self.queue_depth
+        self.recover_ratio = recover_ratio
+        self.min_hold = min_hold
+        self.latency_window = latency_window
+        self.backlog_fn = backlog_fn
+
+        self.mode = NORMAL
+        self._mode_since = time.monotonic()
+        self.in_flight = 0
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=1000)
+        self.served: Dict[str, int] = {}
+        self.switches = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def _model_name(llm: Any) -> str:
+        while not hasattr(llm, "model") and hasattr(llm, "llm"):
+            llm = llm.llm
+        return getattr(llm, "model", type(llm).__name__)
+
+    def depth(self) -> int:
+        """当前积压深度：在途请求 + 外部排队数"""
+        backlog = self.backlog_fn() if self.backlog_fn else 0
+        return self.in_flight + backlog
+
+    def p90_latency(self) -> Optional[float]:
+        """最近 latency_window 秒内主模型的 p90 延迟，没有样本时为 None"""
+        cutoff = time.monotonic() - self.latency_window
+        with self._lock:
+            while self._latencies and self._latencies[0][0] < cutoff:
+                self._latencies.popleft()
+            samples = sorted(latency for _, latency in self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+
+    def _target_mode(self, depth: int, latency: Optional[float]) -> str:
+        """按当前指标计算应处的状态（已考虑恢复的滞回）"""
+        ratio = self.recover_ratio if self.mode != NORMAL else 1.0
+        if self.shed_queue_depth is not None and depth > self.shed_queue_depth * (
+            self.recover_ratio if self.mode == SHEDDING else 1.0
+        ):
+            return SHEDDING
+        slow = latency is not None and latency > self.latency_threshold * ratio
+        if depth > self.queue_depth * ratio or slow:
+            return DEGRADED if self.fallback is not None else SHEDDING
+        return NORMAL
+
+    def update(self) -> str:
+        """根据最新指标更新状态并返回"""
+        depth, latency = self.depth(), self.p90_latency()
+        target = self._target_mode(depth, latency)
+        levels = (NORMAL, DEGRADED, SHEDDING)
+        with self._lock:
+            now = time.monotonic()
+            current = self.mode
+            if target == current:
+                return current
+            # 恶化立即切换；恢复需要停留满 min_hold，并且一次只恢复一级
+            if levels.index(target) < levels.index(current):
+                if now - self._mode_since < self.min_hold:
+                    return current
+                target = levels[levels.index(current) - 1]
+                if target == DEGRADED and self.fallback is None:
+                    target = NORMAL
+            self.mode = target
+            self._mode_since = now
+            self.switches += 1
+
+        latency_text = f"{latency:.1f}s" if latency is not None else "-"
+        log = logger.info if target == NORMAL else logger.warning
+        log(f"负载状态 {current} -> {target}（积压 {depth}，主模型 p90 延迟 {latency_text}）")
+        return target
+
+    def _serve(self, name: str) -> None:
+        self._local.served = name
+        with self._lock:
+            self.served[name] = self.served.get(name, 0) + 1
+
+    def chat(self, messages: List[Dict[str, Any]], degradable: bool = True, **kwargs) -> str:
+        """按当前负载状态选择模型处理请求
+
+        Args:
+            messages: 消息列表
+            degradable: 该请求是否允许降级或被丢弃（高优先级请求传 False）
+            **kwargs: 透传给 chat 的参数
+
+        Returns:
+            生成的文本
+
+        Raises:
+            LoadShed: 处于 shedding 状态且请求可丢弃
+        """
+        self._local.served = None
+        mode = self.update()
+        if degradable and mode == SHEDDING:
+            self._serve("shed")
+            raise LoadShed(f"系统过载（积压 {self.depth()}），请求已丢弃")
+
+        use_fallback = degradable and mode == DEGRADED
+        llm = self.fallback if use_fallback else self.primary
+
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        sent = True
+        try:
+            result = llm.chat(messages, **kwargs)
+        except DeadlineExceeded:
+            sent = False  # 截止时间已过、请求未发送，不代表主模型的延迟
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                # 失败（尤其是超时）的耗时同样计入，否则超时驱动的降级永远不会触发
+                if sent and not use_fallback:
+                    self._latencies.append((time.monotonic(), time.perf_counter() - start))
+
+        self._serve(self._model_name(llm))
+        return result
+
+    def __call__(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        """支持直接调用"""
+        return self.chat(messages, **kwargs)
+
+    def last_served(self) -> Optional[str]:
+        """当前线程上一次请求的处理模型（被丢弃时为 shed，请求失败时为 None）"""
+        return getattr(self._local, "served", None)
+
+    def stats(self) -> Dict[str, Any]:
+        """当前状态、积压、延迟、各模型处理条数及切换次数"""
+        latency = self.p90_latency()
+        return {
+            "mode": self.mode,
+            "depth": self.depth(),
+            "p90_latency": round(latency, 3) if latency is not None else None,
+            "served": dict(self.served),
+            "switches": self.switches,
+        }
+
+
+def create_degradation_policy(
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    fallback_model: Optional[str] = None,
+    wrap: Optional[Callable[[Any], Any]] = None,
+    **kwargs,
+) -> DegradationPolicy:
+    """用 create_llm 创建主模型和降级模型，并包装为 DegradationPolicy
+
+    Args:
+        provider: LLM提供商，两个模型相同
+        model: 主模型名称
+        fallback_model: 降级模型名称，默认 config.FALLBACK_MODEL（None 表示只丢弃不降级）
+        wrap: 对两个模型分别做的包装（如 lambda llm: ContextCacheManager(llm, prefix)）
+        **kwargs: DegradationPolicy 的其他参数
+
+    Returns:
+        DegradationPolicy
+    """
+    wrap = wrap or (lambda llm: llm)
+    fallback_model = fallback_model or getattr(config, "FALLBACK_MODEL", None)
+    primary = wrap(create_llm(provider, model))
+    fallback = wrap(create_llm(provider, fallback_model)) if fallback_model else None
+    return DegradationPolicy(primary, fallback, **kwargs)
@@ -1,40 +1,151 @@
 """日志工具"""
 import sys
+import threading
+import time
 from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
 
 from loguru import logger
 
 import config
 
 
-def setup_logger(log_file: str = "app.log"):
-    """设置日志系统
+# 已添加的 handler：sink 标识 -> handler id，保证重复调用 setup_logger 不会重复添加
+_handlers: Dict[str, int] = {}
+# 当前生效的配置（async_mode / json_format / rate_limit），所有 handler 共用
+_settings: Dict[str, Any] = {}
+_filter: Optional["RateLimitFilter"] = None
+_setup_lock = threading.Lock()
 
-    Args:
-        log_file: 日志文件名
+
+class RateLimitFilter:
+    """按调用位置限流的日志过滤器
+
+    同一行代码每秒最多输出 rate 条日志，超出部分丢弃并计数，
+    下一条放行的日志会附带被抑制的条数，不会悄无声息地丢日志。
+    ERROR 及以上级别的日志不限流。
     """
-    # 移除默认handler
-    logger.remove()
 
-    # 控制台输出
-    logger.add(
-        sys.stderr,
-        format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>",
-        level=config.LOG_LEVEL,
-        colorize=True
-    )
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        """
+        Args:
+            rate: 每个调用位置每秒允许的日志条数
+            burst: 令牌桶容量，默认等于 rate
+        """
+        self.rate = rate
+        self.burst = burst or rate
+        # 调用位置 -> (令牌数, 上次更新时间, 被抑制条数)
+        self._buckets: Dict[Tuple[str, str, int], Tuple[float, float, int]] = {}
+        self._lock = threading.Lock()
+        # 同一条日志在调用线程中依次经过各 handler 的 filter，记住本线程最近一条的判定
+        self._local = threading.local()
+
+    def __call__(self, record) -> bool:
+        if record["level"].no >= logger.level("ERROR").no:
+            return True
+
+        # 同一条日志会依次经过多个 handler，只判定一次（不写入 record，避免进入 JSON 输出）
+        last = getattr(self._local, "last", None)
+        if last is not None and last[0] is record:
+            return last[1]
+
+        decision = self._decide(record)
+        self._local.last = (record, decision)
+        return decision
+
+    def _decide(self, record) -> bool:
+        key = (record["name"], record["function"], record["line"])
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+
+        if suppressed:
+            record["message"] += f"（此前已抑制 {suppressed} 条同类日志）"
+        return True
 
-    # 文件输出
-    log_dir = Path(config.LOG_DIR)
-    log_dir.mkdir(parents=True, exist_ok=True)
 
-    logger.add(
-        log_dir / log_file,
+def _add_handler(key: str) -> int:
+    """按当前配置添加一个 handler（key 为 console 或日志文件路径）"""
+    if key == "console":
+        return logger.add(
+            sys.stderr,
+            format="<green>{time:HH:mm:ss}</green> | <level>{level: <8}</level> | <level>{message}</level>",
+            level=config.LOG_LEVEL,
+            colorize=True,
+            enqueue=_settings["async_mode"],
+            filter=_filter,
+        )
+    return logger.add(
+        Path(key),
         format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {message}",
         level=config.LOG_LEVEL,
         rotation="100 MB",
         retention="7 days",
-        encoding="utf-8"
+        encoding="utf-8",
+        enqueue=_settings["async_mode"],
+        serialize=_settings["json_format"],
+        filter=_filter,
     )
 
+
+def setup_logger(
+    log_file: str = "app.log",
+    async_mode: Optional[bool] = None,
+    json_format: Optional[bool] = None,
+    rate_limit: Optional[float] = None,
+):
+    """设置日志系统（幂等，重复调用不会重复添加 handler）
+
+    首次调用时未传入的参数取 config 中的默认值；之后的调用显式传入与当前不同的参数时，
+    按新配置重建所有已添加的 handler。
+
+    Args:
+        log_file: 日志文件名
+        async_mode: 是否由后台线程写日志（调用方只入队，不阻塞在 I/O 上），默认 config.LOG_ASYNC
+        json_format: 文件日志是否输出为结构化 JSON 行，默认 config.LOG_JSON
+        rate_limit: 每个调用位置每秒最多输出的日志条数，默认 config.LOG_RATE_LIMIT（None 为不限）
+    """
+    global _filter
+    requested = {"async_mode": async_mode, "json_format": json_format, "rate_limit": rate_limit}
+    changes: Dict[str, Any] = {}
+
+    with _setup_lock:
+        if not _handlers:
+            # 移除默认handler
+            logger.remove()
+            _settings.update(
+                async_mode=getattr(config, "LOG_ASYNC", False),
+                json_format=getattr(config, "LOG_JSON", False),
+                rate_limit=getattr(config, "LOG_RATE_LIMIT", None),
+            )
+            _settings.update({k: v for k, v in requested.items() if v is not None})
+            _filter = RateLimitFilter(_settings["rate_limit"]) if _settings["rate_limit"] else None
+        else:
+            changes = {k: v for k, v in requested.items() if v is not None and v != _settings[k]}
+            if changes:
+                _settings.update(changes)
+                if "rate_limit" in changes:
+                    _filter = RateLimitFilter(_settings["rate_limit"]) if _settings["rate_limit"] else None
+                for key, handler_id in list(_handlers.items()):
+                    logger.remove(handler_id)
+                    _handlers[key] = _add_handler(key)
+
+        # 控制台输出
+        if "console" not in _handlers:
+            _handlers["console"] = _add_handler("console")
+
+        # 文件输出
+        log_dir = Path(config.LOG_DIR)
+        log_path = log_dir / log_file
+        if str(log_path) not in _handlers:
+            log_dir.mkdir(parents=True, exist_ok=True)
+            _handlers[str(log_path)] = _add_handler(str(log_path))
+
+    if changes:
+        logger.info(f"日志配置已更新: {changes}")
     return logger
@@ -0,0 +1,182 @@
+"""微批处理：把多条短数据打包进一次请求"""
+import json
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from src.llms import BaseLLM
+
+
+BATCH_INSTRUCTION = (
+    "下面是若干条编号的输入，请逐条独立处理。\n"
+    "只输出一个 JSON 数组，不要输出其他内容，数组中每个元素形如 "
+    '{"index": 编号, "result": "该条的处理结果"}，且每个编号恰好出现一次。'
+)
+
+
+def parse_indexed_results(text: str, expected: int) -> Dict[int, str]:
+    """解析模型返回的编号结果
+
+    Args:
+        text: 模型回复
+        expected: 本批条数，编号范围为 [0, expected)
+
+    Returns:
+        编号 -> 结果；无法解析时返回空字典
+    """
+    # 模型可能在数组前复述编号输入（"[0] ..."）或包裹 ```json```，
+    # 从每个 "[" 起尝试解码，取第一个含编号结果的数组
+    decoder = json.JSONDecoder()
+    start = text.find("[")
+    while start != -1:
+        try:
+            items, _ = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            items = None
+        if isinstance(items, list):
+            results = _collect_results(items, expected)
+            if results:
+                return results
+        start = text.find("[", start + 1)
+    return {}
+
+
+def _collect_results(items: list, expected: int) -> Dict[int, str]:
+    """从解码后的数组中取出编号在 [0, expected) 内的结果"""
+    results: Dict[int, str] = {}
+    for item in items:
+        if not isinstance(item, dict) or "index" not in item or "result" not in item:
+            continue
+        try:
+            index = int(item["index"])
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < expected and index not in results:
+            result = item["result"]
+            results[index] = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+    return results
+
+
+class MicroBatcher:
+    """微批处理器
+
+    按提示长度自适应地把 K 条数据打包成一个请求，要求模型按编号输出 JSON，
+    再拆回逐条结果。解析失败或缺失的条目自动退回逐条调用；
+    请求本身失败时抛出异常，不退回逐条调用。
+
+    用法:
+        batcher = MicroBatcher(llm, "判断下面文本的情感，输出 正面/负面/中性。")
+        results = batcher.run(texts)
+    """
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        instruction: str,
+        max_batch_size: int = 20,
+        max_prompt_chars: int = 6000,
+    ):
+        """
+        Args:
+            llm: LLM实例（或任何提供 chat(messages) 的对象，如 ContextCacheManager）
+            instruction: 对单条数据的任务说明，作为 system prompt
+            max_batch_size: 每批最多条数
+            max_prompt_chars: 每批输入的最大字符数，长文本会自动减少每批条数
+        """
+        self.llm = llm
+        self.instruction = instruction
+        self.max_batch_size = max_batch_size
+        self.max_prompt_chars = max_prompt_chars
+
+    def pack(self, texts: List[str]) -> List[List[int]]:
+        """按长度预算贪心分批
+
+        Args:
+            texts: 输入文本列表
+
+        Returns:
+            每批包含的下标列表
+        """
+        batches: List[List[int]] = []
+        current: List[int] = []
+        size = 0
+
+        for i, text in enumerate(texts):
+            length = len(text)
+            if current and (
+                len(current) >= self.max_batch_size
+                or size + length > self.max_prompt_chars
+            ):
+                batches.append(current)
+                current, size = [], 0
+            current.append(i)
+            size += length
+
+        if current:
+            batches.append(current)
+        return batches
+
+    def build_messages(self, texts: List[str]) -> List[Dict[str, str]]:
+        """构造一批数据的请求消息"""
+        lines = [f"[{i}] {json.dumps(text, ensure_ascii=False)}" for i, text in enumerate(texts)]
+        return [
+            {"role": "system", "content": f"{self.instruction}\n\n{BATCH_INSTRUCTION}"},
+            {"role": "user", "content": "\n".join(lines)},
+        ]
+
+    def process_one(self, text: str, **kwargs) -> str:
+        """逐条调用（回退路径）"""
+        messages = [
+            {"role": "system", "content": self.instruction},
+            {"role": "user", "content": text},
+        ]
+        return self.llm.chat(messages, **kwargs)
+
+    def process_batch(self, texts: List[str], **kwargs) -> List[str]:
+        """处理一批数据
+
+        Args:
+            texts: 本批文本
+            **kwargs: 透传给 llm.chat 的参数
+
+        Returns:
+            与输入一一对应的结果
+
+        Raises:
+            批量请求失败时抛出原异常（只有解析失败或缺失的条目才退回逐条调用）
+        """
+        if len(texts) == 1:
+            return [self.process_one(texts[0], **kwargs)]
+
+        # 请求本身的错误（429、超时、丢弃等）直接抛出，由上层重试；
+        # 此时退回逐条调用会在服务端过载时把请求数放大 K 倍
+        reply = self.llm.chat(self.build_messages(texts), **kwargs)
+        parsed = parse_indexed_results(reply, len(texts))
+
+        missing = [i for i in range(len(texts)) if i not in parsed]
+        if parsed and missing:
+            logger.warning(f"微批结果缺失 {len(missing)}/{len(texts)} 条，退回逐条调用")
+        elif not parsed:
+            logger.warning(f"微批结果无法解析，退回逐条调用 ({len(texts)} 条)")
+
+        for i in missing:
+            parsed[i] = self.process_one(texts[i], **kwargs)
+
+        return [parsed[i] for i in range(len(texts))]
+
+    def run(self, texts: List[str], **kwargs) -> List[str]:
+        """分批处理全部数据（串行；并发时可对 pack() 的结果分别调用 process_batch）
+
+        Args:
+            texts: 输入文本列表
+            **kwargs: 透传给 llm.chat 的参数
+
+        Returns:
+            与输入一一对应的结果
+        """
+        results: List[Optional[str]] = [None] * len(texts)
+        for batch in self.pack(texts):
+            outputs = self.process_batch([texts[i] for i in batch], **kwargs)
+            for i, output in zip(batch, outputs):
+                results[i] = output
+        return results
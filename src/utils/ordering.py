@@ -0,0 +1,104 @@
+"""按长度调度批量数据，输出按原始位置还原"""
+import heapq
+import math
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+POLICIES = ("fifo", "longest_first", "bucketed")
+
+
+def estimate_cost(messages: List[Dict[str, Any]]) -> int:
+    """按消息总字符数粗略估计请求成本（与 prompt tokens 近似成正比）"""
+    total = 0
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, str):
+            total += len(content)
+        elif isinstance(content, list):
+            total += sum(len(block.get("text", "")) for block in content if isinstance(block, dict))
+    return total
+
+
+def _order_window(
+    window: List[Tuple[int, T]],
+    cost_fn: Callable[[T], float],
+    policy: str,
+    bucket_base: float,
+) -> List[Tuple[int, T]]:
+    costs = [cost_fn(item) for _, item in window]
+    if policy == "longest_first":
+        # sorted 是稳定排序，成本相同的保持原有顺序
+        order = sorted(range(len(window)), key=lambda i: -costs[i])
+    else:
+        # 按成本的对数分桶，大桶先发，桶内保持原有顺序，长度相近的请求一起执行
+        order = sorted(
+            range(len(window)),
+            key=lambda i: -math.floor(math.log(costs[i] + 1, bucket_base)),
+        )
+    return [window[i] for i in order]
+
+
+def schedule(
+    items: Iterable[T],
+    cost_fn: Callable[[T], float],
+    policy: str = "longest_first",
+    window: Optional[int] = None,
+    bucket_base: float = 2.0,
+) -> Iterator[Tuple[int, T]]:
+    """按调度策略重排待发送的数据
+
+    文件靠后的超长请求最后才开始，会成为拖慢整批结束的长尾；先发长请求，
+    短请求自然填满其余并发名额，整批的完成时间更接近 总成本 / 并发数。
+
+    Args:
+        items: 数据（按原始顺序）
+        cost_fn: 估计单条数据成本的函数（如 prompt 长度）
+        policy: fifo（原始顺序）/ longest_first（成本从高到低）/ bucketed（按成本分桶，大桶先发）
+        window: 每次读入多少条再排序，None 表示读入全部；输入很大时用于限制内存
+        bucket_base: bucketed 策略相邻桶的成本倍数
+
+    Yields:
+        (原始位置, 数据)，供 restore_order 还原顺序
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"不支持的调度策略: {policy}，可选 {POLICIES}")
+
+    indexed = enumerate(items)
+    if policy == "fifo":
+        yield from indexed
+        return
+
+    buffer: List[Tuple[int, T]] = []
+    for pair in indexed:
+        buffer.append(pair)
+        if window is not None and len(buffer) >= window:
+            yield from _order_window(buffer, cost_fn, policy, bucket_base)
+            buffer = []
+    if buffer:
+        yield from _order_window(buffer, cost_fn, policy, bucket_base)
+
+
+def restore_order(results: Iterable[Tuple[int, T]], start: int = 0) -> Iterator[T]:
+    """把乱序完成的 (原始位置, 结果) 按原始位置依次输出
+
+    只缓存尚未轮到的结果，前面的结果一到就立即输出，可直接接 save_jsonl 流式写出。
+
+    Args:
+        results: (原始位置, 结果)，位置需从 start 开始连续且不重复
+        start: 第一个位置
+
+    Yields:
+        按原始位置排列的结果
+    """
+    pending: List[Tuple[int, int, T]] = []
+    next_position = start
+    # 第二个元素防止位置相同时比较结果本身
+    for seq, (position, result) in enumerate(results):
+        heapq.heappush(pending, (position, seq, result))
+        while pending and pending[0][0] == next_position:
+            yield heapq.heappop(pending)[2]
+            next_position += 1
+
+    if pending:
+        raise ValueError(f"缺少位置 {next_position} 的结果，仍有 {len(pending)} 条未输出")
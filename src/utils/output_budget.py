@@ -0,0 +1,222 @@
+"""按模板自适应 max_tokens"""
+import json
+import math
+import os
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from loguru import logger
+
+from src.data.dedup import payload_key
+from src.llms import BaseLLM
+
+
+def default_template_key(messages: List[Dict[str, Any]]) -> str:
+    """默认的模板键：system 消息相同的请求视为同一模板"""
+    system = [m for m in messages if m.get("role") == "system"]
+    return payload_key(system)[:16]
+
+
+def _base_llm(llm: Any) -> BaseLLM:
+    """穿过 ContextCacheManager、PriorityScheduler 等包装找到底层 BaseLLM"""
+    while not isinstance(llm, BaseLLM):
+        inner = getattr(llm, "llm", None)
+        if inner is None:
+            raise TypeError(f"{type(llm).__name__} 不是 BaseLLM，也没有包装 BaseLLM")
+        llm = inner
+    return llm
+
+
+class _TemplateStats:
+    """单个模板的输出长度样本（滑动窗口）"""
+
+    def __init__(self, window: int):
+        self.samples: Deque[int] = deque(maxlen=window)
+        self.calls = 0
+        self.truncated = 0
+        self.retries = 0
+        self._sorted: Optional[List[int]] = None
+
+    def add(self, tokens: int) -> None:
+        self.samples.append(tokens)
+        self._sorted = None
+
+    def percentile(self, q: float) -> int:
+        """最近邻秩百分位"""
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        rank = max(0, math.ceil(q * len(self._sorted)) - 1)
+        return self._sorted[rank]
+
+
+class AdaptiveMaxTokens:
+    """按模板学习输出长度并自适应设置 max_tokens
+
+    固定的 max_tokens（如 2048）会按上限占用服务端的 TPM 配额，也放任失控的长输出。
+    本组件从每次调用返回的 usage.completion_tokens 中学习各模板的输出长度分布，
+    把 max_tokens 设为高百分位 × 余量；finish_reason 为 length（被截断）的调用
+    以更大的上限重试，只有这部分调用付出额外代价。
+
+    样本不足 min_samples 时使用 llm 自身的 max_tokens。线程安全。
+
+    用法:
+        adaptive = AdaptiveMaxTokens(llm, state_path="data/cache/max_tokens.json")
+        result = adaptive.chat(messages)            # 按 system 消息区分模板
+        result = adaptive.chat(messages, template="extract")
+        adaptive.save()
+    """
+
+    def __init__(
+        self,
+        llm: Any,
+        percentile: float = 0.99,
+        headroom: float = 1.2,
+        min_tokens: int = 64,
+        max_tokens: Optional[int] = None,
+        min_samples: int = 20,
+        window: int = 1000,
+        growth: float = 2.0,
+        template_fn: Callable[[List[Dict[str, Any]]], str] = default_template_key,
+        state_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            llm: LLM实例（也可以是 ContextCacheManager 等包装）
+            percentile: 取输出长度的哪个百分位
+            headroom: 在百分位基础上的放大倍数
+            min_tokens: max_tokens 下限
+            max_tokens: max_tokens 上限（截断重试也不超过），默认 llm.max_tokens 的 4 倍
+            min_samples: 样本数达到该值后才开始自适应
+            window: 每个模板保留最近多少个样本
+            growth: 截断重试时上限的放大倍数
+            template_fn: 未指定 template 时从消息计算模板键
+            state_path: 样本持久化文件，存在时加载，调用 save() 写回
+        """
+        self.llm = llm
+        self.base_llm = _base_llm(llm)
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens or self.base_llm.max_tokens * 4
+        self.min_samples = min_samples
+        self.window = window
+        self.growth = growth
+        self.template_fn = template_fn
+        self.state_path = Path(state_path) if state_path else None
+
+        self._stats: Dict[str, _TemplateStats] = {}
+        self._lock = threading.Lock()
+
+        if self.state_path and self.state_path.exists():
+            self.load()
+
+    def _get_stats(self, template: str) -> _TemplateStats:
+        stats = self._stats.get(template)
+        if stats is None:
+            stats = self._stats[template] = _TemplateStats(self.window)
+        return stats
+
+    def predict(self, template: str) -> int:
+        """当前模板应使用的 max_tokens"""
+        with self._lock:
+            stats = self._stats.get(template)
+            if stats is None or len(stats.samples) < self.min_samples:
+                return min(self.base_llm.max_tokens, self.max_tokens)
+            limit = math.ceil(stats.percentile(self.percentile) * self.headroom)
+        return max(self.min_tokens, min(limit, self.max_tokens))
+
+    def record(self, template: str, completion_tokens: int) -> None:
+        """记录一次未被截断的输出长度"""
+        with self._lock:
+            self._get_stats(template).add(completion_tokens)
+
+    def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        template: Optional[str] = None,
+        **kwargs
+    ) -> str:
+        """以预测的 max_tokens 调用，被截断时放大上限重试
+
+        Args:
+            messages: 消息列表
+            template: 模板名，默认由 template_fn 计算
+            **kwargs: 透传给 llm.chat 的参数（显式传入 max_tokens 时不做自适应）
+
+        Returns:
+            生成的文本（达到上限仍被截断时返回截断的文本）
+        """
+        if kwargs.get("max_tokens") is not None:
+            return self.llm.chat(messages, **kwargs)
+
+        template = template or self.template_fn(messages)
+        limit = self.predict(template)
+        with self._lock:
+            stats = self._get_stats(template)
+            stats.calls += 1
+
+        while True:
+            result = self.llm.chat(messages, max_tokens=limit, **kwargs)
+            info = self.base_llm.last_response()
+            if info.get("finish_reason") != "length":
+                completion_tokens = info.get("usage", {}).get("completion_tokens")
+                if completion_tokens is not None:
+                    self.record(template, completion_tokens)
+                return result
+
+            with self._lock:
+                stats.truncated += 1
+            if limit >= self.max_tokens:
+                logger.warning(f"模板 {template} 的输出在上限 {limit} tokens 处仍被截断")
+                return result
+
+            limit = min(math.ceil(limit * self.growth), self.max_tokens)
+            with self._lock:
+                stats.retries += 1
+            logger.debug(f"模板 {template} 的输出被截断，以 max_tokens={limit} 重试")
+
+    def __call__(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        """支持直接调用"""
+        return self.chat(messages, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各模板的样本数、百分位、当前上限及截断/重试次数"""
+        result = {}
+        for template in list(self._stats):
+            with self._lock:
+                stats = self._stats[template]
+                summary = {
+                    "samples": len(stats.samples),
+                    "calls": stats.calls,
+                    "truncated": stats.truncated,
+                    "retries": stats.retries,
+                }
+                if stats.samples:
+                    summary["p50"] = stats.percentile(0.5)
+                    summary[f"p{round(self.percentile * 100)}"] = stats.percentile(self.percentile)
+            summary["max_tokens"] = self.predict(template)
+            result[template] = summary
+        return result
+
+    def save(self) -> None:
+        """把各模板的样本写入 state_path"""
+        if self.state_path is None:
+            return
+        with self._lock:
+            data = {template: list(stats.samples) for template, stats in self._stats.items()}
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    def load(self) -> None:
+        """从 state_path 加载历史样本"""
+        data = json.loads(self.state_path.read_text(encoding="utf-8"))
+        with self._lock:
+            for template, samples in data.items():
+                stats = self._get_stats(template)
+                for tokens in samples:
+                    stats.add(tokens)
+        logger.info(f"已加载 {len(data)} 个模板的输出长度样本: {self.state_path}")
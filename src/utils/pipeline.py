@@ -0,0 +1,279 @@
+"""多阶段流式处理管道"""
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, MutableMapping, Optional
+
+from loguru import logger
+
+from src.data.dedup import payload_key
+from src.llms import BaseLLM
+
+
+# 阶段函数返回值：None 表示丢弃（过滤），dict 表示一条输出，list 表示多条输出
+StageFn = Callable[[Dict[str, Any]], Any]
+
+_END = object()
+
+
+class Stage:
+    """管道中的一个阶段"""
+
+    def __init__(
+        self,
+        name: str,
+        fn: StageFn,
+        workers: int = 1,
+        queue_size: Optional[int] = None,
+    ):
+        """
+        Args:
+            name: 阶段名
+            fn: 处理函数，输入一条数据，返回 None（丢弃）、dict 或 dict 列表
+            workers: 该阶段的并发线程数
+            queue_size: 该阶段输入队列长度，默认使用 Pipeline 的 queue_size
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue_size = queue_size
+
+        self.received = 0
+        self.emitted = 0
+        self.failed = 0
+        self.busy_time = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, busy: float, emitted: int = 0, failed: bool = False) -> None:
+        """累计处理统计（多个线程共享）"""
+        with self.lock:
+            self.received += 1
+            self.emitted += emitted
+            self.failed += int(failed)
+            self.busy_time += busy
+
+
+def llm_stage(
+    name: str,
+    llm: BaseLLM,
+    build_messages: Callable[[Dict[str, Any]], List[Dict[str, Any]]],
+    output_key: str = "result",
+    workers: int = 4,
+    cache: Optional[MutableMapping[str, str]] = None,
+    **chat_kwargs,
+) -> Stage:
+    """创建调用 LLM 的阶段
+
+    Args:
+        name: 阶段名
+        llm: 该阶段使用的 LLM（不同阶段可以使用不同 provider）
+        build_messages: 从数据构造消息
+        output_key: 回复写入的字段名
+        workers: 并发线程数
+        cache: 该阶段的结果缓存（dict 或其他 MutableMapping），按请求内容去重
+        **chat_kwargs: 透传给 llm.chat 的参数
+
+    Returns:
+        Stage
+    """
+    def run(item: Dict[str, Any]) -> Dict[str, Any]:
+        messages = build_messages(item)
+        key = payload_key(messages, **chat_kwargs) if cache is not None else None
+        if key is not None and key in cache:
+            return {**item, output_key: cache[key]}
+
+        result = llm.chat(messages, **chat_kwargs)
+        if key is not None:
+            cache[key] = result
+        return {**item, output_key: result}
+
+    return Stage(name, run, workers=workers)
+
+
+class Pipeline:
+    """由有界队列连接的多阶段流式管道
+
+    每个阶段有独立的线程数，数据逐条流经各阶段，不落中间文件；
+    下游阶段在上游产出第一条数据后即开始工作。流经所有阶段的数据标记为
+    status=success；某阶段抛出异常的数据标记为 status=failed 后直接输出，不再进入后续阶段。
+    读取输入本身失败（如 JSONL 中有损坏的行）时，已读入的数据处理完后 run() 抛出该异常。
+
+    用法:
+        pipeline = Pipeline([
+            Stage("filter", lambda x: x if x["text"] else None),
+            llm_stage("extract", fast_llm, build_extract_messages, "extracted", workers=8),
+            Stage("parse", parse_extracted),
+            llm_stage("verify", strong_llm, build_verify_messages, "verified", workers=2),
+        ])
+        loader.save_jsonl(pipeline.run(loader.iter_jsonl("input.jsonl")), "output.jsonl")
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 100):
+        """
+        Args:
+            stages: 按顺序执行的阶段
+            queue_size: 阶段间队列的默认长度（背压上限）
+        """
+        if not stages:
+            raise ValueError("至少需要一个阶段")
+        self.stages = stages
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+        self._source_error: Optional[BaseException] = None
+
+    def _put(self, q: queue.Queue, item: Any) -> bool:
+        """带停止检查的阻塞写入，返回是否写入成功"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue) -> Any:
+        """带停止检查的阻塞读取"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _feed(self, source: Iterable[Dict[str, Any]], out: queue.Queue, consumers: int) -> None:
+        try:
+            for item in source:
+                if not self._put(out, item):
+                    return
+        except Exception as e:
+            # 由 run() 在下游处理完已读入的数据后重新抛出，避免输出被静默截断
+            logger.error(f"读取输入失败: {e}")
+            self._source_error = e
+        finally:
+            for _ in range(consumers):
+                self._put(out, _END)
+
+    @staticmethod
+    def _outputs(stage: Stage, output: Any) -> List[Dict[str, Any]]:
+        """把阶段函数的返回值规整为 dict 列表，类型不符时抛出 TypeError"""
+        outputs = [] if output is None else (output if isinstance(output, list) else [output])
+        for out in outputs:
+            if not isinstance(out, dict):
+                raise TypeError(f"阶段 {stage.name} 应返回 None、dict 或 dict 列表，实际为 {type(out).__name__}")
+        return outputs
+
+    def _work(
+        self,
+        stage: Stage,
+        inbox: queue.Queue,
+        outbox: queue.Queue,
+        sink: queue.Queue,
+        done: Dict[str, int],
+        next_consumers: int,
+        lock: threading.Lock,
+    ) -> None:
+        try:
+            self._work_loop(stage, inbox, outbox, sink)
+        finally:
+            # 本阶段最后一个退出的线程通知下游结束（线程意外退出时也要通知，否则 run() 永远等待）
+            with lock:
+                done[stage.name] += 1
+                last = done[stage.name] == stage.workers
+            if last:
+                for _ in range(next_consumers):
+                    self._put(outbox, _END)
+
+    def _work_loop(self, stage: Stage, inbox: queue.Queue, outbox: queue.Queue, sink: queue.Queue) -> None:
+        while True:
+            item = self._get(inbox)
+            if item is _END:
+                return
+
+            start = time.perf_counter()
+            try:
+                outputs = self._outputs(stage, stage.fn(item))
+                if outbox is sink:
+                    outputs = [{**out, "status": "success"} for out in outputs]
+            except Exception as e:
+                stage.record(time.perf_counter() - start, failed=True)
+                logger.error(f"阶段 {stage.name} 处理失败: {e}")
+                failed = item if isinstance(item, dict) else {"item": item}
+                self._put(sink, {**failed, "status": "failed", "error": str(e), "failed_stage": stage.name})
+                continue
+
+            stage.record(time.perf_counter() - start, emitted=len(outputs))
+            for out in outputs:
+                if not self._put(outbox, out):
+                    return
+
+    def run(self, source: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """流式运行管道
+
+        Args:
+            source: 输入数据（可以是 DataLoader.iter_jsonl 返回的迭代器）
+
+        Yields:
+            流经所有阶段的数据（status=success）及失败的数据（status=failed），顺序不保证与输入一致
+
+        Raises:
+            读取 source 时抛出的异常（在已读入的数据全部输出之后）
+        """
+        self._stop.clear()
+        self._source_error = None
+        queues = [
+            queue.Queue(maxsize=stage.queue_size or self.queue_size)
+            for stage in self.stages
+        ]
+        # 最后一个阶段的输出与失败数据共用 sink
+        sink: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        done = {stage.name: 0 for stage in self.stages}
+        lock = threading.Lock()
+
+        threads = [threading.Thread(
+            target=self._feed,
+            args=(source, queues[0], self.stages[0].workers),
+            name="pipeline-feed",
+            daemon=True,
+        )]
+        for i, stage in enumerate(self.stages):
+            is_last = i == len(self.stages) - 1
+            outbox = sink if is_last else queues[i + 1]
+            next_consumers = 1 if is_last else self.stages[i + 1].workers
+            for n in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], outbox, sink, done, next_consumers, lock),
+                    name=f"pipeline-{stage.name}-{n}",
+                    daemon=True,
+                ))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = self._get(sink)
+                if item is _END:
+                    break
+                yield item
+            if self._source_error is not None:
+                raise self._source_error
+        finally:
+            # 提前停止迭代时通知所有线程退出
+            self._stop.set()
+            for thread in threads:
+                thread.join(timeout=1.0)
+            logger.info(f"管道结束: {self.stats()}")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段的处理统计（busy_time 可用于定位瓶颈阶段）"""
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "received": stage.received,
+                "emitted": stage.emitted,
+                "failed": stage.failed,
+                "busy_time": round(stage.busy_time, 3),
+            }
+            for stage in self.stages
+        }
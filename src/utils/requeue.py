@@ -0,0 +1,226 @@
+"""延迟重新入队的重试（不在工作线程中 sleep）"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, List, Optional, Tuple
+
+from loguru import logger
+
+import config
+from src.llms import Deadline, DeadlineExceeded
+from src.llms.tracing import tracer
+
+from .degradation import LoadShed
+
+
+class DelayQueue:
+    """按到期时间出队的线程安全队列（最小堆）"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Any]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def put(self, item: Any, delay: float) -> None:
+        """delay 秒后 item 可被取出"""
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), item))
+            self._cond.notify()
+
+    def get(self) -> Optional[Any]:
+        """阻塞直到有到期的数据；队列关闭且为空时返回 None"""
+        with self._cond:
+            while True:
+                if self._heap:
+                    wait = self._heap[0][0] - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self._heap)[2]
+                elif self._closed:
+                    return None
+                else:
+                    wait = None
+                self._cond.wait(wait)
+
+    def close(self) -> None:
+        """关闭队列，已有数据到期后仍会被取出"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def _default_retry_on(error: BaseException) -> bool:
+    return not isinstance(error, (DeadlineExceeded, LoadShed))
+
+
+class _Task:
+    """一条数据的所有尝试共享的状态"""
+
+    __slots__ = ("fn", "args", "kwargs", "future", "attempt", "delay")
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, delay: float):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future: Future = Future()
+        self.attempt = 0
+        self.delay = delay
+
+
+class RequeueExecutor:
+    """失败后延迟重新入队的重试执行器
+
+    retry_on_failure 在工作线程里 sleep 退避，一波 429 会让所有线程同时睡眠，
+    健康的数据只能排队等待。这里失败的尝试立即释放线程，按退避时间放入延迟队列，
+    到期后由后台线程重新提交到线程池，其间线程池继续处理其他数据。
+
+    退避规则与 retry_on_failure 相同（指数退避，截止时间不足时放弃），
+    另加少量随机抖动，避免同一波失败的请求在同一时刻一起重试。
+
+    用法:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            requeue = RequeueExecutor(pool)
+            futures = [requeue.submit(process_item, item, deadline=Deadline(300)) for item in items]
+            for future in as_completed(futures):
+                ...  # 成功时为返回值；重试耗尽时抛出最后一次的异常
+            requeue.shutdown()
+    """
+
+    def __init__(
+        self,
+        executor: Executor,
+        max_retries: Optional[int] = None,
+        initial_delay: Optional[float] = None,
+        max_delay: Optional[float] = None,
+        jitter: float = 0.1,
+        retry_on: Callable[[BaseException], bool] = _default_retry_on,
+    ):
+        """
+        Args:
+            executor: 执行每次尝试的线程池
+            max_retries: 最大尝试次数，默认 config.MAX_RETRIES
+            initial_delay: 初始退避时间（秒），默认 config.RETRY_DELAY
+            max_delay: 最大退避时间（秒），默认 config.MAX_RETRY_DELAY
+            jitter: 退避时间的随机抖动比例
+            retry_on: 判断异常是否值得重试，默认超时放弃和过载丢弃不重试
+        """
+        self.executor = executor
+        self.max_retries = max_retries or config.MAX_RETRIES
+        self.initial_delay = initial_delay or config.RETRY_DELAY
+        self.max_delay = max_delay or config.MAX_RETRY_DELAY
+        self.jitter = jitter
+        self.retry_on = retry_on
+
+        self.delayed = DelayQueue()
+        self.queued = 0  # 已提交到线程池、尚未开始的尝试
+        self.pending = 0  # 尚未得到最终结果的数据
+        self.retries = 0
+        self._lock = threading.Lock()
+        self._timer = threading.Thread(target=self._dispatch_due, name="requeue-timer", daemon=True)
+        self._timer.start()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """提交一条数据，返回其最终结果的 Future
+
+        kwargs 中的 deadline（Deadline 或秒数）在所有尝试间共享；
+        kwargs 中有 enqueued_ns 时，每次重新入队都更新为当时的 perf_counter_ns()。
+        """
+        deadline = Deadline.coerce(kwargs.get("deadline"))
+        if deadline is not None:
+            kwargs["deadline"] = deadline
+        task = _Task(fn, args, kwargs, self.initial_delay)
+        with self._lock:
+            self.pending += 1
+        self._dispatch(task)
+        return task.future
+
+    def backlog(self) -> int:
+        """等待执行的尝试数：线程池中排队的 + 延迟队列中的"""
+        return self.queued + len(self.delayed)
+
+    def _dispatch(self, task: _Task) -> None:
+        with self._lock:
+            self.queued += 1
+        self.executor.submit(self._run, task)
+
+    def _dispatch_due(self) -> None:
+        """后台线程：把到期的重试重新提交到线程池"""
+        while True:
+            task = self.delayed.get()
+            if task is None:
+                return
+            # 排队时间从重新入队时算起，不包含之前的尝试和退避
+            if "enqueued_ns" in task.kwargs:
+                task.kwargs["enqueued_ns"] = time.perf_counter_ns()
+            try:
+                self._dispatch(task)
+            except RuntimeError as e:
+                # 线程池已关闭
+                with self._lock:
+                    self.queued -= 1
+                self._finish(task, error=e)
+
+    def _finish(self, task: _Task, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.pending -= 1
+        if error is not None:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(result)
+
+    def _run(self, task: _Task) -> None:
+        with self._lock:
+            self.queued -= 1
+        task.attempt += 1
+        try:
+            result = task.fn(*task.args, **task.kwargs)
+        except Exception as e:
+            self._on_error(task, e)
+        except BaseException as e:
+            # KeyboardInterrupt 等不重试，但必须结束 Future，否则调用方会一直等待
+            self._finish(task, error=e)
+            raise
+        else:
+            self._finish(task, result)
+
+    def _on_error(self, task: _Task, error: Exception) -> None:
+        if not self.retry_on(error):
+            self._finish(task, error=error)
+            return
+        if task.attempt >= self.max_retries:
+            logger.error(f"执行失败，已重试{self.max_retries}次: {error}")
+            self._finish(task, error=error)
+            return
+
+        delay = task.delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+        deadline = task.kwargs.get("deadline")
+        if deadline is not None and deadline.remaining() <= delay:
+            logger.error(f"执行失败，剩余时间不足以重试: {error}")
+            expired = DeadlineExceeded(f"剩余 {max(deadline.remaining(), 0):.1f}s，放弃重试")
+            expired.__cause__ = error
+            self._finish(task, error=expired)
+            return
+
+        logger.warning(f"执行失败 (尝试 {task.attempt}/{self.max_retries})，{delay:.1f} 秒后重新入队: {error}")
+        tracer.instant("requeue", attempt=task.attempt, delay=delay)
+        task.delay = min(task.delay * 2, self.max_delay)
+        with self._lock:
+            self.retries += 1
+        self.delayed.put(task, delay)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """停止后台调度线程
+
+        Args:
+            wait: 是否等待延迟队列中的重试全部到期并提交
+        """
+        self.delayed.close()
+        if wait:
+            self._timer.join()
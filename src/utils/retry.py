@@ -6,6 +6,10 @@ from typing import Callable
 from loguru import logger
 
 import config
+from src.llms import Deadline, DeadlineExceeded
+from src.llms.tracing import tracer
+
+from .degradation import LoadShed
 
 
 def retry_on_failure(
@@ -15,6 +19,10 @@ def retry_on_failure(
 ):
     """重试装饰器
 
+    超时放弃（DeadlineExceeded）和过载丢弃（LoadShed）不重试。
+    被装饰函数的 deadline 关键字参数（Deadline 或秒数）在所有尝试间共享：
+    剩余预算不足以等待下一次重试时直接放弃，不再重试。
+
     Args:
         max_retries: 最大重试次数
         initial_delay: 初始延迟时间（秒）
@@ -28,18 +36,28 @@ def retry_on_failure(
         @wraps(func)
         def wrapper(*args, **kwargs):
             delay = initial_delay
+            # 秒数在此换算为绝对截止时间，避免每次重试重新计时
+            deadline = Deadline.coerce(kwargs.get("deadline"))
+            if deadline is not None:
+                kwargs["deadline"] = deadline
 
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
+                except (DeadlineExceeded, LoadShed):
+                    raise
                 except Exception as e:
                     if attempt == max_retries - 1:
                         logger.error(f"执行失败，已重试{max_retries}次: {e}")
                         raise
+                    if deadline is not None and deadline.remaining() <= delay:
+                        logger.error(f"执行失败，剩余时间不足以重试: {e}")
+                        raise DeadlineExceeded(f"剩余 {max(deadline.remaining(), 0):.1f}s，放弃重试") from e
 
                     logger.warning(f"执行失败 (尝试 {attempt + 1}/{max_retries}): {e}")
                     logger.info(f"等待 {delay:.1f} 秒后重试...")
-                    time.sleep(delay)
+                    with tracer.span("retry_backoff", attempt=attempt + 1, delay=delay):
+                        time.sleep(delay)
                     delay = min(delay * 2, max_delay)
 
             raise RuntimeError("不应到达此处")
@@ -0,0 +1,215 @@
+"""带优先级通道的请求调度器"""
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from src.llms import BaseLLM
+from src.llms.tracing import tracer
+
+
+class Lane:
+    """调度通道配置与统计"""
+
+    def __init__(
+        self,
+        name: str,
+        weight: float = 1.0,
+        reserved: int = 0,
+        max_wait: Optional[float] = None,
+    ):
+        """
+        Args:
+            name: 通道名
+            weight: 权重，空闲名额按权重比例分配
+            reserved: 为该通道预留的并发名额，其他通道不可占用
+            max_wait: 排队超过该秒数的请求优先放行（防饿死），None 表示不限制
+        """
+        self.name = name
+        self.weight = weight
+        self.reserved = reserved
+        self.max_wait = max_wait
+
+        self.queue: Deque["_Ticket"] = deque()
+        self.in_flight = 0
+        self.served = 0
+        self.virtual_time = 0.0
+        self.waits: Deque[float] = deque(maxlen=1000)
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """通道排队等待统计"""
+        waits = sorted(self.waits)
+        p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0
+        return {
+            "waiting": len(self.queue),
+            "in_flight": self.in_flight,
+            "served": self.served,
+            "wait_avg": self.total_wait / self.served if self.served else 0.0,
+            "wait_p95": p95,
+            "wait_max": self.max_wait_seen,
+        }
+
+
+class _Ticket:
+    __slots__ = ("lane", "enqueued_at", "granted")
+
+    def __init__(self, lane: Lane):
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class PriorityScheduler:
+    """在 BaseLLM 前面按优先级通道调度请求
+
+    - 加权公平：空闲名额按各通道权重分配（stride 调度）
+    - 预留名额：每个通道可预留若干并发，批量任务无法挤占
+    - 防饿死：排队超过 max_wait 的请求优先放行
+    - 统计：每个通道的排队等待时间
+
+    用法:
+        scheduler = PriorityScheduler(llm, max_concurrency=16, lanes=[
+            Lane("interactive", weight=8, reserved=4, max_wait=1.0),
+            Lane("bulk", weight=1, max_wait=60.0),
+        ])
+        scheduler.chat(messages, lane="interactive")
+    """
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        max_concurrency: int,
+        lanes: List[Lane],
+        default_lane: Optional[str] = None,
+    ):
+        """
+        Args:
+            llm: LLM实例（或任何提供 chat(messages) 的对象）
+            max_concurrency: 总并发上限
+            lanes: 通道列表
+            default_lane: 未指定通道时使用的通道，默认第一个
+        """
+        if not lanes:
+            raise ValueError("至少需要一个通道")
+        if sum(lane.reserved for lane in lanes) > max_concurrency:
+            raise ValueError("预留名额之和超过总并发上限")
+
+        self.llm = llm
+        self.max_concurrency = max_concurrency
+        self.lanes: Dict[str, Lane] = {lane.name: lane for lane in lanes}
+        self.default_lane = default_lane or lanes[0].name
+
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def _can_grant(self, lane: Lane) -> bool:
+        if self._in_flight >= self.max_concurrency:
+            return False
+        if lane.in_flight < lane.reserved:
+            return True
+        # 其他通道尚未用满的预留名额不可占用
+        held = sum(
+            max(0, other.reserved - other.in_flight)
+            for other in self.lanes.values()
+            if other is not lane
+        )
+        return self._in_flight + held < self.max_concurrency
+
+    def _pick_lane(self) -> Optional[Lane]:
+        candidates = [lane for lane in self.lanes.values() if lane.queue and self._can_grant(lane)]
+        if not candidates:
+            return None
+
+        now = time.monotonic()
+        overdue = [
+            lane for lane in candidates
+            if lane.max_wait is not None and now - lane.queue[0].enqueued_at > lane.max_wait
+        ]
+        if overdue:
+            return min(overdue, key=lambda lane: lane.queue[0].enqueued_at)
+        return min(candidates, key=lambda lane: lane.virtual_time)
+
+    def _dispatch(self) -> None:
+        """尽可能放行排队中的请求（需持有锁）"""
+        granted = False
+        while True:
+            lane = self._pick_lane()
+            if lane is None:
+                break
+            ticket = lane.queue.popleft()
+            ticket.granted = True
+            granted = True
+
+            wait = time.monotonic() - ticket.enqueued_at
+            lane.waits.append(wait)
+            lane.total_wait += wait
+            lane.max_wait_seen = max(lane.max_wait_seen, wait)
+            lane.served += 1
+            lane.virtual_time += 1.0 / lane.weight
+            lane.in_flight += 1
+            self._in_flight += 1
+        if granted:
+            self._cond.notify_all()
+
+    def acquire(self, lane: Optional[str] = None) -> Lane:
+        """在指定通道排队，直到获得并发名额
+
+        Args:
+            lane: 通道名
+
+        Returns:
+            获得名额的通道，用完后传给 release()
+        """
+        name = lane or self.default_lane
+        if name not in self.lanes:
+            raise ValueError(f"未知的通道: {name}")
+
+        with self._cond:
+            target = self.lanes[name]
+            if not target.queue:
+                # 空闲后重新激活的通道不能凭累积的"欠账"长期独占名额
+                active = [l.virtual_time for l in self.lanes.values() if l.queue or l.in_flight]
+                if active:
+                    target.virtual_time = max(target.virtual_time, min(active))
+            ticket = _Ticket(target)
+            target.queue.append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                self._cond.wait()
+            return target
+
+    def release(self, lane: Lane) -> None:
+        """归还名额"""
+        with self._cond:
+            lane.in_flight -= 1
+            self._in_flight -= 1
+            self._dispatch()
+
+    def chat(self, messages: List[Dict[str, Any]], lane: Optional[str] = None, **kwargs) -> str:
+        """经过调度后调用 llm.chat
+
+        Args:
+            messages: 消息列表
+            lane: 通道名，默认 default_lane
+            **kwargs: 透传给 llm.chat 的参数
+
+        Returns:
+            生成的文本
+        """
+        with tracer.span("lane_wait", lane=lane or self.default_lane):
+            granted = self.acquire(lane)
+        try:
+            return self.llm.chat(messages, **kwargs)
+        finally:
+            self.release(granted)
+
+    def __call__(self, messages: List[Dict[str, Any]], **kwargs) -> str:
+        """支持直接调用"""
+        return self.chat(messages, **kwargs)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各通道的排队与等待时间统计"""
+        with self._cond:
+            return {name: lane.stats() for name, lane in self.lanes.items()}